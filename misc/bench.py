@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+# vim:set ts=4 sw=4 et:
+
+"""
+mesure les performances des commandes de sysbus contre le simulateur de Livebox
+
+Chaque commande est exécutée dans un processus séparé, avec un répertoire de cache vide:
+    wall        durée de la commande (s)
+    startup     délai entre le lancement du processus et sa première requête (s)
+    cpu         temps CPU du processus sysbus, user + sys (s)
+    rss         pic de mémoire résidente (Mo)
+    requests    nombre d'allers-retours HTTP, authentification comprise
+    bytes       octets reçus de la Livebox
+
+La durée d'import de sysbus.sysbus est mesurée à part. Le benchmark échoue (code de retour 1)
+si cet import charge un des modules qui doivent l'être à la demande (MODULES_DIFFERES), et, sur
+demande, si le démarrage d'une commande dépasse --max-startup ou l'import --max-import (objectif:
+60 ms, atteint avec les réponses en cache ou le démon, pas quand requests doit être chargé).
+
+exemples:
+    ./bench.py                                  toutes les commandes, 30 ms de latence
+    ./bench.py -n 5 --latency 50 hosts model    médiane de 5 exécutions
+    ./bench.py -o avant.json                    résultats en JSON
+    ./bench.py --compare avant.json             compare avec des résultats précédents
+    ./bench.py --max-startup 60 time            échoue si le démarrage dépasse 60 ms
+"""
+
+import sys
+import os
+import json
+import time
+import shutil
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.request
+
+src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, src)
+
+from sysbus import simulator
+
+
+##
+# @brief commandes mesurées: nom -> arguments de sysbus
+COMMANDES = {
+    "time":         [ "Time:getTime" ],
+    "hosts":        [ "-hosts" ],
+    "info":         [ "-info" ],
+    "model":        [ "-model" ],
+    "modelraw":     [ "-modelraw", "-out", "model.json" ],
+    "mibs-html":    [ "-MIBs", "table", "html" ],
+    "mibs-dump":    [ "-MIBs", "dump" ],
+    "topo":         [ "-topo", "noview" ],
+}
+
+##
+# @brief modules chargés à la demande, qui ne doivent pas l'être par l'import de sysbus.sysbus
+MODULES_DIFFERES = ("requests", "urllib3", "ssl", "http.client", "sqlite3", "asyncio", "graphviz", "qrcode")
+
+##
+# @brief métriques, dans l'ordre d'affichage
+METRIQUES = ("wall", "startup", "cpu", "rss", "requests", "bytes")
+
+
+##
+# @brief exécute une commande sysbus et mesure ses ressources
+#
+# @param sysbus ligne de commande de sysbus
+# @param args
+# @param env
+# @param cwd
+# @param url url du simulateur
+#
+# @return dict des métriques
+def mesure(sysbus, args, env, cwd, url):
+    urllib.request.urlopen(url + "_stats?reset=1").read()
+
+    debut = time.perf_counter()
+    lancement = time.time()
+    p = subprocess.Popen(sysbus + args, env=env, cwd=cwd, stdin=subprocess.DEVNULL,
+                         stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    erreurs = p.stderr.read()
+    _, status, ru = os.wait4(p.pid, 0)
+    wall = time.perf_counter() - debut
+    p.returncode = os.waitstatus_to_exitcode(status) if hasattr(os, "waitstatus_to_exitcode") else status >> 8
+
+    stats = json.loads(urllib.request.urlopen(url + "_stats").read().decode("utf-8"))
+
+    # ru_maxrss est en Ko sous Linux, en octets sous macOS
+    rss = ru.ru_maxrss / (1048576. if sys.platform == "darwin" else 1024.)
+
+    # sans requête, le démarrage est la durée de la commande
+    startup = stats['first'] - lancement if stats.get('first') else wall
+
+    return { "wall": wall, "startup": startup, "cpu": ru.ru_utime + ru.ru_stime, "rss": rss,
+             "requests": stats['requests'], "bytes": stats['bytes_out'],
+             "exit": p.returncode, "stderr": erreurs.decode("utf-8", errors="replace")[-2000:] }
+
+
+##
+# @brief mesure la durée d'import de sysbus.sysbus, dans un processus neuf à chaque fois
+#
+# @param env
+# @param repeat nombre de mesures
+#
+# @return (médiane (s), modules de MODULES_DIFFERES chargés par l'import)
+def mesure_import(env, repeat):
+    code = ("import sys, json, time; t = time.perf_counter(); import sysbus.sysbus; t = time.perf_counter() - t; "
+            "print(json.dumps([ t, [ m for m in %r if m in sys.modules ] ]))" % (MODULES_DIFFERES,))
+    mesures = [ json.loads(subprocess.check_output([ sys.executable, "-c", code ], env=env, stdin=subprocess.DEVNULL))
+                for _ in range(repeat) ]
+    return statistics.median(t for t, _ in mesures), sorted(set(m for _, l in mesures for m in l))
+
+
+##
+# @brief lance le benchmark
+#
+# @param args
+#
+# @return dict des résultats
+def bench(args):
+    if args.fixtures:
+        fixtures = simulator.Fixtures.charge(args.fixtures)
+    else:
+        fixtures = simulator.Fixtures.synthetique(args.synthetic, args.intfs, args.hosts)
+
+    srv = simulator.demarre(fixtures, latence=args.latency / 1000., cpu=args.cpu / 1000.,
+                            debit=args.bandwidth * 1024, workers=args.workers)
+
+    tmp = tempfile.mkdtemp(prefix="sysbus-bench-")
+    try:
+        home = os.path.join(tmp, "home")
+        os.makedirs(home)
+        with open(os.path.join(home, ".sysbusrc"), "w") as f:
+            f.write("[main]\nURL_LIVEBOX = %s\nUSER_LIVEBOX = admin\nPASSWORD_LIVEBOX = admin\nVERSION_LIVEBOX = lb4\n" % srv.url)
+
+        env = dict(os.environ)
+        env.update({ "HOME": home, "SYSBUS_DAEMON": "0", "PYTHONPATH": src + os.pathsep + env.get("PYTHONPATH", "") })
+
+        sysbus = args.sysbus.split() if args.sysbus else [ sys.executable, "-m", "sysbus.sysbus" ]
+        options = args.options.split() if args.options else []
+
+        resultats = { "config": { "latency": args.latency, "cpu": args.cpu, "bandwidth": args.bandwidth,
+                                  "workers": args.workers, "objects": len(fixtures.objets),
+                                  "interfaces": len(fixtures.mibs), "repeat": args.repeat,
+                                  "options": options, "python": sys.version.split()[0] },
+                      "commands": {} }
+
+        resultats["import"], resultats["import_modules"] = mesure_import(env, args.repeat)
+        ref = (args.reference or {}).get("import")
+        print("%-10s  %7.3f s%s" % ("import", resultats["import"],
+                                    " (%+4.0f%%)" % ((resultats["import"] - ref) * 100. / ref) if ref else ""), flush=True)
+
+        for nom in args.commandes or list(COMMANDES):
+            runs = []
+            for k in range(args.repeat):
+                # chaque exécution part d'un cache vide (authentification et réponses)
+                cwd = os.path.join(tmp, "run")
+                cache = os.path.join(tmp, "cache")
+                for d in (cwd, cache):
+                    shutil.rmtree(d, ignore_errors=True)
+                    os.makedirs(d)
+                env["XDG_CACHE_HOME"] = cache
+                runs.append(mesure(sysbus, options + COMMANDES[nom], env, cwd, srv.url))
+
+            r = { m: statistics.median(run[m] for run in runs) for m in METRIQUES }
+            r["exit"] = max(run["exit"] for run in runs)
+            r["runs"] = [ { m: run[m] for m in METRIQUES } for run in runs ]
+            resultats["commands"][nom] = r
+
+            affiche(nom, r, args.reference)
+            if r["exit"] != 0 and args.verbose:
+                print(runs[-1]["stderr"], file=sys.stderr)
+
+        return resultats
+
+    finally:
+        srv.shutdown()
+        srv.server_close()
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+##
+# @brief affiche le résultat d'une commande, avec le rapport aux résultats de référence
+#
+# @param nom
+# @param r
+# @param reference
+#
+# @return
+def affiche(nom, r, reference=None):
+    formats = { "wall": "%7.3f s", "startup": "%7.3f s", "cpu": "%7.3f s", "rss": "%6.1f Mo", "requests": "%5d req", "bytes": "%10d o" }
+    ref = (reference or {}).get("commands", {}).get(nom)
+    s = "%-10s" % nom
+    for m in METRIQUES:
+        s += "  " + formats[m] % r[m]
+        if ref and ref.get(m):
+            s += " (%+4.0f%%)" % ((r[m] - ref[m]) * 100. / ref[m])
+    if r["exit"] != 0:
+        s += "  [code %d]" % r["exit"]
+    print(s, flush=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="benchmark des commandes de sysbus",
+                                     epilog="commandes: " + " ".join(COMMANDES))
+    parser.add_argument("commandes", nargs="*", metavar="COMMANDE")
+    parser.add_argument("-n", "--repeat", help="nombre d'exécutions par commande (médiane)", type=int, default=3)
+    parser.add_argument("-d", "--fixtures", help="dump de Livebox à rejouer")
+    parser.add_argument("--synthetic", help="nombre d'objets du datamodel synthétique", type=int, default=2000)
+    parser.add_argument("--intfs", help="nombre d'interfaces NeMo synthétiques", type=int, default=40)
+    parser.add_argument("--hosts", help="nombre d'équipements synthétiques", type=int, default=30)
+    parser.add_argument("--latency", help="latence par requête (ms)", type=float, default=30.)
+    parser.add_argument("--cpu", help="temps de sérialisation par Mo de réponse (ms)", type=float, default=200.)
+    parser.add_argument("--bandwidth", help="débit de la Livebox (Ko/s, 0: illimité)", type=float, default=0.)
+    parser.add_argument("--workers", help="requêtes traitées simultanément par la Livebox", type=int, default=4)
+    parser.add_argument("--sysbus", help="commande sysbus à mesurer (par défaut: celle des sources)")
+    parser.add_argument("--options", help="options passées à sysbus, ex: '-j 1'")
+    parser.add_argument("--compare", help="résultats JSON de référence", metavar="FICHIER")
+    parser.add_argument("--max-startup", help="délai maximal jusqu'à la première requête (ms, objectif: 60), "
+                        "code de retour 1 si dépassé", type=float, metavar="MS")
+    parser.add_argument("--max-import", help="durée maximale de l'import de sysbus.sysbus (ms), "
+                        "code de retour 1 si dépassée", type=float, metavar="MS")
+    parser.add_argument("-o", "--output", help="écrit les résultats en JSON", metavar="FICHIER")
+    parser.add_argument("-v", "--verbose", help="affiche les erreurs des commandes", action="store_true")
+    args = parser.parse_args()
+
+    for nom in args.commandes:
+        if nom not in COMMANDES:
+            parser.error("commande inconnue: %s" % nom)
+
+    args.reference = None
+    if args.compare:
+        with open(args.compare) as f:
+            args.reference = json.load(f)
+
+    resultats = bench(args)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(resultats, f, indent=4)
+            f.write("\n")
+
+    echec = False
+    if resultats["import_modules"]:
+        print("modules chargés par l'import de sysbus.sysbus au lieu de l'être à la demande: %s"
+              % " ".join(resultats["import_modules"]), file=sys.stderr)
+        echec = True
+    if args.max_import and resultats["import"] * 1000. > args.max_import:
+        print("import de sysbus.sysbus supérieur à %g ms: %.0f ms" % (args.max_import, resultats["import"] * 1000.),
+              file=sys.stderr)
+        echec = True
+    if args.max_startup:
+        lents = [ nom for nom, r in resultats["commands"].items() if r["startup"] * 1000. > args.max_startup ]
+        if lents:
+            print("démarrage supérieur à %g ms: %s" % (args.max_startup, " ".join(lents)), file=sys.stderr)
+            echec = True
+    if echec:
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+# -*- encoding: utf-8 -*-
+# vim:set ts=4 sw=4 et:
+
+"""
+mesure la mémoire et le débit de la base OUI (sysbus.manuf)
+
+Chaque forme de la base est chargée dans un processus séparé:
+    table       base analysée en mémoire (index_name=False)
+    index       index compilé projeté en mémoire
+
+    load        durée du chargement (s)
+    rss         mémoire résidente ajoutée par le chargement puis les recherches unitaires (Mo)
+    search      recherches unitaires par seconde (get_manuf)
+    bulk        recherches groupées par seconde (get_manuf_many)
+
+Les résultats de search() et get_all() sur l'échantillon sont comparés entre les deux formes.
+
+exemples:
+    ./bench_oui.py
+    ./bench_oui.py -n 200000 -o apres.json
+"""
+
+import sys
+import os
+import json
+import time
+import random
+import hashlib
+import argparse
+import tempfile
+import subprocess
+
+src = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, src)
+
+MANUF = os.path.join(src, "sysbus", "manuf")
+
+
+##
+# @brief mémoire résidente du processus (Mo)
+#
+# @return
+def rss():
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 1048576.
+    except OSError:
+        import resource
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / (1048576. if sys.platform == "darwin" else 1024.)
+
+
+##
+# @brief échantillon d'adresses MAC: préfixes de la base complétés au hasard, et adresses inconnues
+#
+# @param manuf
+# @param n
+#
+# @return
+def echantillon(manuf, n):
+    prefixes = []
+    with open(manuf, encoding="utf-8") as f:
+        for ligne in f:
+            if ligne[:1] not in ("", "#", "\n"):
+                p = ligne.split("\t", 1)[0].split("/")[0].replace(":", "").replace("-", "").replace(".", "")
+                if len(p) <= 12:
+                    prefixes.append(p)
+    r = random.Random(1)
+    macs = []
+    for k in range(n):
+        if k % 4 == 3:
+            p = ""
+        else:
+            p = r.choice(prefixes)
+        h = p + "".join(r.choice("0123456789abcdef") for _ in range(12 - len(p)))
+        macs.append(":".join(h[i:i + 2] for i in range(0, 12, 2)))
+    return macs
+
+
+##
+# @brief mesure une forme de la base (processus fils)
+#
+# @param args
+#
+# @return
+def mesure(args):
+    from sysbus.manuf import MacParser
+
+    macs = echantillon(args.manuf, args.n)
+    avant = rss()
+
+    t = time.perf_counter()
+    parser = MacParser(args.manuf, index_name=False if args.child == "table" else args.index)
+    load = time.perf_counter() - t
+    charge = rss()
+
+    t = time.perf_counter()
+    for mac in macs:
+        parser.get_manuf(mac)
+    search = len(macs) / (time.perf_counter() - t)
+    apres = rss()
+
+    bulk = None
+    if hasattr(parser, "get_manuf_many"):
+        t = time.perf_counter()
+        parser.get_manuf_many(macs)
+        bulk = len(macs) / (time.perf_counter() - t)
+
+    h = hashlib.sha1()
+    for mac in macs[:20000]:
+        h.update(repr(parser.search(mac, maximum=3)).encode("utf-8"))
+        h.update(repr(parser.get_all(mac)).encode("utf-8"))
+
+    json.dump({ "load": load, "rss_load": charge - avant, "rss": apres - avant, "search": search, "bulk": bulk,
+                "digest": h.hexdigest() }, sys.stdout)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="mémoire et débit de la base OUI")
+    parser.add_argument("-n", help="nombre d'adresses recherchées", type=int, default=100000)
+    parser.add_argument("--manuf", help="fichier manuf", default=MANUF)
+    parser.add_argument("--compare", help="résultats JSON de référence", metavar="FICHIER")
+    parser.add_argument("-o", "--output", help="écrit les résultats en JSON", metavar="FICHIER")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    parser.add_argument("--index", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        return mesure(args)
+
+    reference = None
+    if args.compare:
+        with open(args.compare) as f:
+            reference = json.load(f)
+
+    resultats = {}
+    with tempfile.TemporaryDirectory(prefix="sysbus-oui-") as tmp:
+        index = os.path.join(tmp, "manuf.idx")
+        for forme in ("table", "index"):
+            cmd = [ sys.executable, os.path.abspath(__file__), "--child", forme, "-n", str(args.n),
+                    "--manuf", args.manuf, "--index", index ]
+            if forme == "index":
+                # construit l'index, puis mesure son ouverture
+                subprocess.check_output(cmd)
+            resultats[forme] = r = json.loads(subprocess.check_output(cmd).decode("utf-8"))
+
+            s = "%-6s  load %7.3f s  rss %6.1f Mo (chargement %6.1f Mo)  search %8d/s" % (
+                forme, r["load"], r["rss"], r["rss_load"], r["search"])
+            if r["bulk"]:
+                s += "  bulk %8d/s" % r["bulk"]
+            ref = (reference or {}).get(forme)
+            if ref:
+                s += "  [rss %+.1f Mo, %s]" % (r["rss"] - ref["rss"], "résultats identiques" if ref["digest"] == r["digest"] else "RÉSULTATS DIFFÉRENTS")
+            print(s, flush=True)
+
+    if resultats["table"]["digest"] != resultats["index"]["digest"]:
+        print("les résultats de la table et de l'index diffèrent", file=sys.stderr)
+        sys.exit(1)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(resultats, f, indent=4)
+            f.write("\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -39,7 +39,7 @@ setup(
     python_requires=">=3.6",
     install_requires=["requests", "graphviz", "qrcode", "python-dateutil"],
     package_data={"sysbus": ["manuf"]},
-    entry_points={"console_scripts": ["sysbus=sysbus.sysbus:main"]},
+    entry_points={"console_scripts": ["sysbus=sysbus.sysbus:main", "sysbus-simulator=sysbus.simulator:main"]},
     project_urls={
         "Source": "https://github.com/rene-d/sysbus",
         "Bug Reports": "https://github.com/rene-d/sysbus/issues",
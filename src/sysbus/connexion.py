@@ -0,0 +1,85 @@
+#! /usr/bin/env python3
+# -*- encoding: utf-8 -*-
+# vim:set ts=4 sw=4 et:
+
+"""
+connexions HTTP instrumentées
+
+Adaptateur requests dont les connexions mesurent la résolution DNS et l'établissement de la
+connexion pour la mesure en cours dans le thread (cf. tracing).
+
+Le module n'est importé qu'à la première requête envoyée à la Livebox: requests et urllib3
+représentent une bonne part du temps de démarrage de sysbus.
+"""
+
+import socket
+
+import requests
+import requests.utils
+import requests.adapters
+import urllib3
+import urllib3.exceptions
+import urllib3.util.connection
+
+try:
+    from . import tracing
+except ImportError:
+    import tracing
+
+
+##
+# @brief connexion HTTP qui mesure la résolution DNS et l'établissement de la connexion
+class ConnexionMesuree:
+
+    def _new_conn(self):
+        m = tracing.courante()
+        hote = getattr(self, '_dns_host', None)
+        if m is tracing.NULLE or hote is None:
+            return super()._new_conn()
+
+        m.compte('connections')
+        with m.phase('dns'):
+            try:
+                famille = urllib3.util.connection.allowed_gai_family()
+                adresses = [r[4][0] for r in socket.getaddrinfo(hote.strip("[]"), self.port, famille, socket.SOCK_STREAM)]
+                adresses = list(dict.fromkeys(adresses))
+            except OSError:
+                # l'erreur sera signalée par la connexion elle-même
+                adresses = [hote]
+        # toutes les adresses sont essayées dans l'ordre, comme le fait urllib3 (IPv6 puis IPv4 par exemple)
+        try:
+            with m.phase('connect'):
+                for n, ip in enumerate(adresses, 1):
+                    self._dns_host = ip
+                    try:
+                        return super()._new_conn()
+                    except (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ConnectTimeoutError):
+                        if n == len(adresses):
+                            raise
+        finally:
+            self._dns_host = hote
+
+
+class ConnexionHTTP(ConnexionMesuree, urllib3.connection.HTTPConnection):
+    pass
+
+
+class ConnexionHTTPS(ConnexionMesuree, urllib3.connection.HTTPSConnection):
+    pass
+
+
+class PoolHTTP(urllib3.HTTPConnectionPool):
+    ConnectionCls = ConnexionHTTP
+
+
+class PoolHTTPS(urllib3.HTTPSConnectionPool):
+    ConnectionCls = ConnexionHTTPS
+
+
+##
+# @brief adaptateur requests dont les connexions sont mesurées
+class AdaptateurMesure(requests.adapters.HTTPAdapter):
+
+    def init_poolmanager(self, *args, **kwargs):
+        super().init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = { 'http': PoolHTTP, 'https': PoolHTTPS }
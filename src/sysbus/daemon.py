@@ -0,0 +1,330 @@
+#! /usr/bin/env python3
+# -*- encoding: utf-8 -*-
+# vim:set ts=4 sw=4 et:
+
+"""
+démon sysbus et client léger
+
+Le démon garde en mémoire la session authentifiée, la base OUI et les caches. Le client lui
+transmet la ligne de commandes et le répertoire courant via une socket Unix locale, puis
+recopie les sorties standard et d'erreur renvoyées par le démon.
+
+Protocole: une ligne JSON par message
+    client -> démon : {"argv": [...], "cwd": "..."}
+    démon -> client : {"fd": 1 ou 2, "data": "..."} ... puis {"exit": code}
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import socket
+import hashlib
+import tempfile
+import subprocess
+import configparser
+
+
+##
+# @brief le démon s'arrête après ce délai sans client (secondes)
+DAEMON_TIMEOUT = 900
+
+##
+# @brief délai d'attente du démon lancé automatiquement (secondes)
+SPAWN_TIMEOUT = 10
+
+##
+# @brief options qui s'exécutent toujours localement
+LOCAL_OPTIONS = ("--daemon", "--no-daemon", "--update-oui")
+
+##
+# @brief options qui désignent la Livebox et l'utilisateur de la session (le mot de passe n'en
+#        fait pas partie: il n'apparaît pas dans la ligne de commandes du démon)
+BOX_OPTIONS = ("-url", "-user", "-lversion")
+
+
+##
+# @brief extrait les options de la Livebox d'une ligne de commandes
+#
+# @param argv
+#
+# @return liste normalisée [option, valeur, ...]
+def box_options(argv):
+    options = []
+    k = 0
+    while k < len(argv):
+        a = argv[k]
+        nom, egal, valeur = a.partition("=")
+        if nom in BOX_OPTIONS:
+            if not egal:
+                k += 1
+                if k >= len(argv):
+                    break
+                valeur = argv[k]
+            options.extend([nom, valeur])
+        k += 1
+    return options
+
+
+##
+# @brief retourne le chemin de la socket du démon, dans un répertoire accessible uniquement
+#        par l'utilisateur (le démon détient une session admin sur la Livebox); chaque Livebox
+#        désignée sur la ligne de commandes a son propre démon
+#
+# @param options options de la Livebox (cf. box_options)
+#
+# @return
+def socket_path(options=()):
+    base = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    d = os.path.join(base, "sysbus-%d" % os.getuid())
+    os.makedirs(d, mode=0o700, exist_ok=True)
+    st = os.stat(d)
+    if st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise PermissionError("répertoire %s non sûr" % d)
+    if not options:
+        return os.path.join(d, "daemon.sock")
+    cle = "\n".join(options)
+    return os.path.join(d, "daemon-%s.sock" % hashlib.sha1(cle.encode("utf-8")).hexdigest()[:16])
+
+
+##
+# @brief indique si les commandes doivent passer par le démon:
+#        variable d'environnement SYSBUS_DAEMON ou clé daemon de la section [main] de ~/.sysbusrc
+#
+# @param argv
+#
+# @return
+def client_enabled(argv):
+    if not hasattr(socket, "AF_UNIX"):
+        return False
+    if any(a in LOCAL_OPTIONS for a in argv):
+        return False
+    # la lecture de l'entrée standard n'est pas transmise au démon
+    if "-batch" in argv and argv.index("-batch") + 1 < len(argv) and argv[argv.index("-batch") + 1] == "-":
+        return False
+
+    flag = os.environ.get("SYSBUS_DAEMON")
+    if flag is None:
+        config = configparser.ConfigParser()
+        try:
+            config.read(os.path.expanduser("~") + "/" + ".sysbusrc")
+            flag = config.get('main', 'daemon', fallback='false')
+        except configparser.Error:
+            return False
+    return flag.lower() in ['true', 'yes', '1']
+
+
+##
+# @brief flux texte qui transmet les écritures au client
+class _Flux(io.TextIOBase):
+
+    def __init__(self, conn, fd, line_buffering=False):
+        self._conn = conn
+        self._fd = fd
+        self._line_buffering = line_buffering
+        self._buffer = []
+        self._size = 0
+        # vrai quand le client a fermé la connexion
+        self.rompu = False
+
+    @property
+    def encoding(self):
+        return "utf-8"
+
+    def writable(self):
+        return True
+
+    def isatty(self):
+        return False
+
+    def write(self, s):
+        if self.rompu:
+            raise BrokenPipeError("client déconnecté")
+        self._buffer.append(s)
+        self._size += len(s)
+        if self._size >= 65536 or (self._line_buffering and "\n" in s):
+            self.flush()
+        return len(s)
+
+    def flush(self):
+        if self._size == 0:
+            return
+        data = "".join(self._buffer)
+        self._buffer = []
+        self._size = 0
+        try:
+            send(self._conn, {"fd": self._fd, "data": data})
+        except OSError:
+            self.rompu = True
+            raise
+
+
+##
+# @brief envoie un message JSON sur la socket
+#
+# @param conn
+# @param msg
+#
+# @return
+def send(conn, msg):
+    conn.sendall(json.dumps(msg).encode("utf-8") + b"\n")
+
+
+##
+# @brief boucle principale du démon: exécute les commandes reçues l'une après l'autre
+#
+# @param run fonction qui exécute une ligne de commandes (la fonction main de sysbus)
+# @param options options de la Livebox servie (cf. box_options)
+#
+# @return
+def serve(run, options=()):
+    path = socket_path(options)
+
+    # un démon est-il déjà actif ?
+    if os.path.exists(path):
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(path)
+            s.close()
+            print("démon déjà actif:", path, file=sys.stderr)
+            return 1
+        except OSError:
+            os.unlink(path)
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    server.bind(path)
+    os.chmod(path, 0o600)
+    server.listen(8)
+    server.settimeout(DAEMON_TIMEOUT)
+
+    stdout, stderr, cwd = sys.stdout, sys.stderr, os.getcwd()
+
+    try:
+        while True:
+            try:
+                conn, _ = server.accept()
+            except socket.timeout:
+                break
+
+            with conn:
+                try:
+                    requete = json.loads(conn.makefile("rb").readline().decode("utf-8"))
+                except (OSError, ValueError):
+                    continue
+
+                out = _Flux(conn, 1)
+                err = _Flux(conn, 2, line_buffering=True)
+                sys.stdout, sys.stderr = out, err
+                code = 0
+                message = None
+                try:
+                    os.chdir(requete.get("cwd") or cwd)
+                    run(requete["argv"])
+                except SystemExit as e:
+                    code = e.code if isinstance(e.code, int) else (0 if e.code is None else 1)
+                    if not isinstance(e.code, (int, type(None))):
+                        message = str(e.code)
+                except Exception as e:
+                    message = "erreur: " + repr(e)
+                    code = 1
+                finally:
+                    # -out a pu rediriger la sortie standard vers un fichier
+                    if sys.stdout is not out:
+                        sys.stdout.close()
+                    sys.stdout, sys.stderr = stdout, stderr
+                    os.chdir(cwd)
+
+                # le client est parti (sysbus ... | head par exemple): on ne lui écrit plus rien
+                if out.rompu or err.rompu:
+                    continue
+                try:
+                    if message is not None:
+                        err.write(message + "\n")
+                    out.flush()
+                    err.flush()
+                    send(conn, {"exit": code})
+                except OSError:
+                    pass
+    finally:
+        server.close()
+        if os.path.exists(path):
+            os.unlink(path)
+
+    return 0
+
+
+##
+# @brief lance le démon en arrière-plan et attend qu'il soit prêt
+#
+# @param path chemin de la socket
+# @param options options de la Livebox, transmises au démon pour qu'il écoute sur la même socket
+#
+# @return la socket connectée, ou None
+def spawn(path, options=()):
+    # lancé comme module (sys.argv[0] n'est pas un script avec python -m ou une zipapp), le
+    # paquet sysbus étant retrouvé là d'où il a été importé
+    cmd = [sys.executable, "-m", "sysbus.sysbus", "--daemon"] + list(options)
+    env = dict(os.environ)
+    racine = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [racine, env.get("PYTHONPATH")]))
+    try:
+        subprocess.Popen(cmd, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                         close_fds=True, start_new_session=True, env=env)
+    except OSError:
+        return None
+
+    fin = time.monotonic() + SPAWN_TIMEOUT
+    while time.monotonic() < fin:
+        time.sleep(0.05)
+        s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            s.connect(path)
+            return s
+        except OSError:
+            s.close()
+    return None
+
+
+##
+# @brief transmet la ligne de commandes au démon (lancé si nécessaire) et recopie ses sorties
+#
+# @param argv
+#
+# @return code de sortie de la commande, ou None si le démon est inaccessible
+def client(argv):
+    options = box_options(argv)
+    try:
+        path = socket_path(options)
+    except OSError:
+        return None
+
+    s = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        s.connect(path)
+    except OSError:
+        s.close()
+        s = spawn(path, options)
+        if s is None:
+            return None
+
+    with s:
+        send(s, {"argv": list(argv), "cwd": os.getcwd()})
+        flux = { 1: sys.stdout, 2: sys.stderr }
+        try:
+            for ligne in s.makefile("rb"):
+                msg = json.loads(ligne.decode("utf-8"))
+                if "exit" in msg:
+                    sys.stdout.flush()
+                    return msg["exit"]
+                flux[msg["fd"]].write(msg["data"])
+                if msg["fd"] == 2:
+                    sys.stderr.flush()
+        except BrokenPipeError:
+            # la sortie a été fermée (sysbus ... | head): la fermeture de la socket interrompt
+            # la commande dans le démon, et l'interpréteur ne doit plus écrire dans le tube
+            os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+            return 1
+
+    # le démon s'est arrêté en cours de commande
+    return 1
@@ -20,27 +20,397 @@ See README.md.
 from __future__ import print_function
 from collections import namedtuple
 import argparse
+import array
+import bisect
+import itertools
+import json
+import mmap
 import re
+import struct
 import sys
 import io
+import tempfile
 
 try:
     from urllib2 import urlopen
+    from urllib2 import Request
+    from urllib2 import HTTPError
     from urllib2 import URLError
 except ImportError:
     from urllib.request import urlopen
+    from urllib.request import Request
+    from urllib.error import HTTPError
     from urllib.error import URLError
 
-try:
-    from StringIO import StringIO
-except ImportError:
-    from io import StringIO
 import importlib
 import os
 
 # Vendor tuple
 Vendor = namedtuple('Vendor', ['manuf', 'manuf_long', 'comment'])
 
+
+def _write_atomic(file_name, write, mode=0o644):
+    """Writes a file through a temporary file in the same directory, then renames it.
+
+    Args:
+        file_name (str): Location of the file.
+        write (callable): Called with the temporary file, opened in binary mode.
+        mode (int): Permissions of the file.
+
+    Raises:
+        IOError: If the file could not be written.
+
+    """
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_name)), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            write(f)
+        os.chmod(tmp, mode)
+        os.replace(tmp, file_name)
+    except:
+        os.unlink(tmp)
+        raise
+
+
+class _OuiLookup(object):
+    """Lookups shared by the in-memory and the memory-mapped forms of the database.
+
+    Subclasses set ``_masks``, a list of (mask, prefixes, vendor numbers) sorted by mask length,
+    with sorted prefixes, and ``_cache``, the Vendor of each number (None until decoded). They
+    provide ``vendor(number)``, which returns the Vendor of a number, decoding and caching it
+    when needed.
+
+    """
+    def search(self, mac_int, bits_left, maximum=1):
+        """Searches the vendors of a MAC address, closest result first.
+
+        Args:
+            mac_int (int): MAC address, as returned by MacParser._get_mac_int().
+            bits_left (int): Number of bits not given in the MAC address.
+            maximum (int): Maximum results to return.
+
+        Returns:
+            List of Vendor namedtuples.
+
+        """
+        vendors = []
+        for mask, keys, values in self._masks:
+            # If the user only gave us X bits, check X bits. No partial matching!
+            if mask < bits_left:
+                continue
+            prefix = mac_int >> mask
+            i = bisect.bisect_left(keys, prefix)
+            if i < len(keys) and keys[i] == prefix:
+                vendors.append(self._cache[values[i]] or self.vendor(values[i]))
+                if len(vendors) >= maximum:
+                    break
+        return vendors
+
+    def mask_lengths(self):
+        """Returns the mask lengths present in the database, in increasing order."""
+        return [mask for mask, _, _ in self._masks]
+
+    def lookup_many(self, mask, prefixes):
+        """Looks up a list of prefixes for one mask length.
+
+        Large batches are resolved with a hash table of the prefixes of that mask length, built
+        on first use and kept: it costs memory, but less time than the binary searches as soon
+        as the batch holds more than a quarter of the prefixes.
+
+        Args:
+            mask (int): Mask length, one of mask_lengths().
+            prefixes (list): MAC addresses shifted right by the mask length.
+
+        Returns:
+            List of Vendor namedtuples aligned with the prefixes, None where not found.
+
+        """
+        for m, keys, values in self._masks:
+            if m == mask:
+                break
+        else:
+            return [None] * len(prefixes)
+        vendor = self.vendor
+        cache = self._cache
+
+        table = self._tables.get(mask)
+        if table is None and 4 * len(prefixes) >= len(keys):
+            table = self._tables[mask] = dict(zip(keys, values))
+        if table is not None:
+            get = table.get
+            found = [get(prefix) for prefix in prefixes]
+            return [None if i is None else cache[i] or vendor(i) for i in found]
+
+        count = len(keys)
+        bisect_left = bisect.bisect_left
+        found = [bisect_left(keys, prefix) for prefix in prefixes]
+        return [cache[values[i]] or vendor(values[i]) if i < count and keys[i] == prefix else None
+                for prefix, i in zip(prefixes, found)]
+
+
+class OuiTable(_OuiLookup):
+    """Parsed form of the manuf database, laid out like OuiIndex.
+
+    For each mask length, the prefixes are held in a sorted array of 64-bit integers and the
+    vendor numbers in a parallel array of 32-bit integers, instead of one dict entry and one
+    tuple key per prefix. Each distinct vendor is stored once, and its strings are shared with
+    the other vendors.
+
+    Args:
+        masks (list): (mask, prefixes, vendor numbers) sorted by mask length, the prefixes being
+            sorted.
+        vendors (list): Vendor namedtuples, by number.
+
+    """
+    def __init__(self, masks, vendors):
+        self._masks = masks
+        self._cache = vendors
+        self._tables = {}
+
+    @classmethod
+    def from_entries(cls, entries):
+        """Builds a table from database entries.
+
+        Args:
+            entries (iterable): (mask, prefix, Vendor) tuples. A prefix given several times for
+                the same mask keeps its last vendor.
+
+        Returns:
+            OuiTable
+
+        """
+        strings = {}
+        intern = strings.setdefault
+        numbers = {}
+        by_mask = {}
+        for mask, prefix, vendor in entries:
+            number = numbers.get(vendor)
+            if number is None:
+                # equal fields of distinct vendors share one string
+                manuf, manuf_long, comment = vendor
+                vendor = Vendor(intern(manuf, manuf), intern(manuf_long, manuf_long), intern(comment, comment))
+                number = numbers[vendor] = len(numbers)
+            if mask not in by_mask:
+                by_mask[mask] = (array.array("Q"), array.array("I"))
+            keys, values = by_mask[mask]
+            keys.append(prefix)
+            values.append(number)
+
+        vendors = [None] * len(numbers)
+        for vendor, number in numbers.items():
+            vendors[number] = vendor
+
+        masks = []
+        for mask in sorted(by_mask):
+            keys, values = by_mask.pop(mask)
+            # the database is sorted: only sort (and deduplicate) when it is not
+            if any(a >= b for a, b in zip(keys, itertools.islice(keys, 1, None))):
+                prefixes = sorted(dict(zip(keys, values)).items())
+                keys = array.array("Q", (prefix for prefix, _ in prefixes))
+                values = array.array("I", (number for _, number in prefixes))
+            masks.append((mask, keys, values))
+        return cls(masks, vendors)
+
+    def vendor(self, number):
+        """Returns a Vendor from its number in the table."""
+        return self._cache[number]
+
+    def vendors(self):
+        """Returns the Vendor namedtuples of the table, by number."""
+        return list(self._cache)
+
+    def masks(self):
+        """Returns the (mask, prefixes, vendor numbers) arrays of the table."""
+        return list(self._masks)
+
+
+class OuiIndex(_OuiLookup):
+    """Compiled form of the manuf database, memory-mapped for lookups.
+
+    The index holds, for each mask length present in the database, the sorted prefixes and
+    the matching vendor numbers, then the vendor records (three string offsets) and a
+    deduplicated string table. Opening it costs a header read: lookups are binary searches in
+    the mapped file, whose pages are shared by all the processes using it.
+
+    The index records the modification time and size of the manuf file it was built from, and
+    is considered stale as soon as they differ. It also records its own size, so that a truncated
+    file is rejected instead of being mapped.
+
+    Args:
+        index_name (str): Location of the index file.
+
+    Raises:
+        IOError: If the index could not be opened.
+        ValueError: If the file is not a valid index.
+
+    """
+    MAGIC = b"MANUFIDX"
+    VERSION = 2
+
+    # magic, version, byte order, source mtime (ns) and size, mask count, vendor count,
+    # offset of the vendor records, offset of the string table, size of the index
+    _HEADER = struct.Struct("=8sIIqqIIQQQ")
+    # mask, prefix count, offset of the prefixes, offset of the vendor numbers
+    _MASK = struct.Struct("=IIQQ")
+    _BYTE_ORDER = 0x01020304
+    _NONE = 0xFFFFFFFF
+
+    def __init__(self, index_name):
+        with io.open(index_name, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            (magic, version, byte_order, self.source_mtime, self.source_size,
+             mask_count, vendor_count, vendors_offset, self._strings_offset,
+             index_size) = self._HEADER.unpack_from(self._mmap)
+            if magic != self.MAGIC or version != self.VERSION or byte_order != self._BYTE_ORDER:
+                raise ValueError("Unsupported OUI index")
+        except (struct.error, ValueError):
+            self._mmap.close()
+            raise ValueError("Invalid OUI index: {0}".format(index_name))
+
+        # a truncated or partially written file must be rejected before the sections are cast
+        size = len(self._mmap)
+        try:
+            if index_size != size:
+                raise ValueError("Truncated OUI index")
+            sections = []
+            for k in range(mask_count):
+                mask, count, keys_offset, values_offset = self._MASK.unpack_from(
+                    self._mmap, self._HEADER.size + k * self._MASK.size)
+                sections.append((mask, keys_offset, 8 * count, values_offset, 4 * count))
+            if any(keys_offset + keys_size > size or values_offset + values_size > size
+                   for _, keys_offset, keys_size, values_offset, values_size in sections):
+                raise ValueError("Truncated OUI index")
+            if vendors_offset + 12 * vendor_count > size or self._strings_offset > size:
+                raise ValueError("Truncated OUI index")
+        except (struct.error, ValueError):
+            self._mmap.close()
+            raise ValueError("Invalid OUI index: {0}".format(index_name))
+
+        view = memoryview(self._mmap)
+        self._masks = []
+        for mask, keys_offset, keys_size, values_offset, values_size in sections:
+            self._masks.append((mask,
+                                view[keys_offset:keys_offset + keys_size].cast("Q"),
+                                view[values_offset:values_offset + values_size].cast("I")))
+        self._vendors = view[vendors_offset:vendors_offset + 12 * vendor_count].cast("I")
+        self._cache = [None] * vendor_count
+        self._tables = {}
+
+    @classmethod
+    def open(cls, index_name, manuf_name):
+        """Opens an index if it is up to date with the manuf file.
+
+        Args:
+            index_name (str): Location of the index file.
+            manuf_name (str): Location of the manuf database file.
+
+        Returns:
+            OuiIndex, or None if the index is missing, invalid or stale.
+
+        """
+        try:
+            st = os.stat(manuf_name)
+            index = cls(index_name)
+        except (IOError, OSError, ValueError, TypeError):
+            return None
+        if index.source_mtime != st.st_mtime_ns or index.source_size != st.st_size:
+            index.close()
+            return None
+        return index
+
+    @classmethod
+    def build(cls, table, index_name, manuf_name):
+        """Writes the index of a parsed database, atomically.
+
+        Args:
+            table (OuiTable): Parsed database.
+            index_name (str): Location of the index file.
+            manuf_name (str): Location of the manuf database file the table comes from.
+
+        Raises:
+            IOError: If the index could not be written.
+
+        """
+        st = os.stat(manuf_name)
+
+        strings = {}
+        blob = io.BytesIO()
+
+        def string(value):
+            if value is None:
+                return cls._NONE
+            if value not in strings:
+                data = value.encode("utf-8")
+                strings[value] = blob.tell()
+                blob.write(struct.pack("=I", len(data)))
+                blob.write(data)
+            return strings[value]
+
+        vendors = table.vendors()
+        records = array.array("I")
+        for vendor in vendors:
+            records.extend(string(v) for v in vendor)
+        masks = table.masks()
+
+        def align(n):
+            return (n + 7) & ~7
+
+        offset = align(cls._HEADER.size + len(masks) * cls._MASK.size)
+        header_masks = []
+        sections = []
+        for mask, keys, values in masks:
+            keys_offset = offset
+            values_offset = keys_offset + 8 * len(keys)
+            offset = align(values_offset + 4 * len(values))
+            header_masks.append(cls._MASK.pack(mask, len(keys), keys_offset, values_offset))
+            sections.append((keys_offset, keys))
+            sections.append((values_offset, values))
+        vendors_offset = offset
+        strings_offset = align(vendors_offset + 4 * len(records))
+        sections.append((vendors_offset, records))
+        sections.append((strings_offset, blob.getvalue()))
+        index_size = strings_offset + blob.tell()
+
+        header = cls._HEADER.pack(cls.MAGIC, cls.VERSION, cls._BYTE_ORDER, st.st_mtime_ns, st.st_size,
+                                  len(masks), len(vendors), vendors_offset, strings_offset, index_size)
+
+        def write(f):
+            f.write(header)
+            f.write(b"".join(header_masks))
+            for section_offset, data in sections:
+                f.write(b"\0" * (section_offset - f.tell()))
+                f.write(data if isinstance(data, bytes) else data.tobytes())
+
+        # the index may be shared by all the users of the manuf file
+        _write_atomic(index_name, write, 0o644)
+
+    def close(self):
+        """Releases the mapping."""
+        for _, keys, values in self._masks:
+            keys.release()
+            values.release()
+        self._vendors.release()
+        self._masks = []
+        self._tables = {}
+        self._mmap.close()
+
+    def _string(self, offset):
+        if offset == self._NONE:
+            return None
+        start = self._strings_offset + offset
+        length, = struct.unpack_from("=I", self._mmap, start)
+        return self._mmap[start + 4:start + 4 + length].decode("utf-8")
+
+    def vendor(self, number):
+        """Returns a Vendor from its number in the index."""
+        vendor = self._cache[number]
+        if vendor is None:
+            vendor = Vendor(*(self._string(self._vendors[3 * number + k]) for k in range(3)))
+            self._cache[number] = vendor
+        return vendor
+
+
 class MacParser(object):
     """Class that contains a parser for Wireshark's OUI database.
 
@@ -50,10 +420,17 @@ class MacParser(object):
 
     See https://www.wireshark.org/tools/oui-lookup.html
 
+    The parsed database (see OuiTable) is compiled into an index (see OuiIndex), rebuilt
+    whenever the manuf file changes: later instances map the index instead of parsing the file.
+
     Args:
         manuf_name (str): Location of the manuf database file. Defaults to "manuf" in the same
             directory.
         update (bool): Whether to update the manuf file automatically. Defaults to False.
+        index_name (str): Location of the compiled index. Defaults to the manuf file name
+            followed by ".idx". False to always parse the manuf file.
+        refresh (bool): Whether to load the database now. Defaults to True. Otherwise it is
+            loaded by the first lookup, or by update() if the manuf file changes.
 
     Raises:
         IOError: If manuf file could not be found.
@@ -62,11 +439,15 @@ class MacParser(object):
     MANUF_URL = "https://gitlab.com/wireshark/wireshark/-/raw/master/manuf"
     WFA_URL = "https://gitlab.com/wireshark/wireshark/-/raw/master/wka"
 
-    def  __init__(self, manuf_name=None, update=False):
+    def  __init__(self, manuf_name=None, update=False, index_name=None, refresh=True):
         self._manuf_name = manuf_name or self.get_packaged_manuf_file_path()
+        self._index_name = index_name
+        self._index = None
+        self._table = None
         if update:
-            self.update()
-        else:
+            # the database is loaded once, whether it changed or not
+            self.update(refresh=False)
+        if refresh:
             self.refresh()
 
     def refresh(self, manuf_name=None):
@@ -82,11 +463,51 @@ class MacParser(object):
         """
         if not manuf_name:
             manuf_name = self._manuf_name
-        with io.open(manuf_name, "r", encoding="utf-8") as read_file:
-            manuf_file = StringIO(read_file.read())
-        self._masks = {}
 
-        # Build mask -> result dict
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+        self._table = None
+
+        index_name = self._get_index_name(manuf_name)
+        if index_name:
+            self._index = OuiIndex.open(index_name, manuf_name)
+            if self._index is not None:
+                return
+
+        table = self._parse(manuf_name)
+        if index_name:
+            try:
+                OuiIndex.build(table, index_name, manuf_name)
+                self._index = OuiIndex.open(index_name, manuf_name)
+            except (IOError, OSError):
+                # read-only location: keep the parsed database
+                pass
+        if self._index is None:
+            self._table = table
+
+    def _get_index_name(self, manuf_name):
+        if self._index_name is False:
+            return None
+        return self._index_name or manuf_name + ".idx"
+
+    def _lookup(self):
+        if self._index is None and self._table is None:
+            self.refresh()
+        return self._index if self._index is not None else self._table
+
+    def _parse(self, manuf_name):
+        """Parses the manuf database file.
+
+        Returns:
+            OuiTable
+
+        """
+        with io.open(manuf_name, "r", encoding="utf-8") as manuf_file:
+            return OuiTable.from_entries(self._entries(manuf_file))
+
+    def _entries(self, manuf_file):
+        """Yields the (mask, prefix, Vendor) entries of the manuf database, one line at a time."""
         for line in manuf_file:
             try:
                 line = line.strip()
@@ -109,71 +530,128 @@ class MacParser(object):
                 comment = fields[3].strip("#").strip() if len(fields) > 3 else None
                 long_name = fields[2] if len(fields) > 2 else None
 
-                self._masks[(mask, mac_int >> mask)] = Vendor(manuf=fields[1], manuf_long=long_name, comment=comment)
             except:
                 print( "Couldn't parse line", line)
                 raise
 
-
-        manuf_file.close()
+            yield mask, mac_int >> mask, Vendor(manuf=fields[1], manuf_long=long_name, comment=comment)
 
     def update(self, manuf_url=None, wfa_url=None, manuf_name=None, refresh=True):
         """Update the Wireshark OUI database to the latest version.
 
+        The OUI and WFA databases are streamed into a temporary file, which then replaces the
+        manuf file atomically. The validators of the downloads (ETag, Last-Modified, or size and
+        modification time of a local file) are kept next to the manuf file, so that unchanged
+        sources are not downloaded again.
+
         Args:
-            manuf_url (str): URL pointing to OUI database. Defaults to database located at
-                code.wireshark.org.
+            manuf_url (str): URL or local path of the OUI database. Defaults to database located
+                at gitlab.com.
+            wfa_url (str): URL or local path of the WFA database, appended to the OUI database.
+                Defaults to database located at gitlab.com.
             manuf_name (str): Location to store the new OUI database. Defaults to "manuf" in the
                 same directory.
             refresh (bool): Refresh the database once updated. Defaults to True. Uses database
                 stored at manuf_name.
 
+        Returns:
+            bool: Whether the manuf file was replaced.
+
         Raises:
             URLError: If the download fails
+            IOError: If a local source could not be read, or the manuf file written.
 
         """
-        if not manuf_url:
-            manuf_url = self.MANUF_URL
         if not manuf_name:
             manuf_name = self._manuf_name
+        sources = [("OUI", manuf_url or self.MANUF_URL), ("WFA", wfa_url or self.WFA_URL)]
+        state_name = manuf_name + ".update.json"
 
-        # Retrieve the new database
+        # the validators only hold for the manuf file they were recorded with
+        validators = {}
         try:
-            response = urlopen(manuf_url)
-        except URLError:
-            raise URLError("Failed downloading OUI database")
-
-        # Parse the response
-        if response.code == 200:
-            with open(manuf_name, "wb") as write_file:
-                write_file.write(response.read())
-            if refresh:
-                self.refresh(manuf_name)
-        else:
-            err = "{0} {1}".format(response.code, response.msg)
-            raise URLError("Failed downloading database: {0}".format(err))
+            with io.open(state_name, "r", encoding="utf-8") as f:
+                state = json.load(f)
+            st = os.stat(manuf_name)
+            if state.get("mtime_ns") == st.st_mtime_ns and state.get("size") == st.st_size:
+                validators = state.get("sources") or {}
+        except (IOError, OSError, ValueError):
+            pass
+
+        opened = []
+        try:
+            for label, source in sources:
+                opened.append(self._open_source(label, source, validators.get(source)))
+            if all(stream is None for stream, _ in opened):
+                return False
+
+            # one source changed: the manuf file is rebuilt from both
+            for k, (label, source) in enumerate(sources):
+                if opened[k][0] is None:
+                    opened[k] = self._open_source(label, source, None)
+
+            def write(f):
+                for stream, _ in opened:
+                    last = b"\n"
+                    for chunk in iter(lambda: stream.read(65536), b""):
+                        f.write(chunk)
+                        last = chunk[-1:]
+                    if last != b"\n":
+                        f.write(b"\n")
+
+            mode = os.stat(manuf_name).st_mode & 0o777 if os.path.exists(manuf_name) else 0o644
+            _write_atomic(manuf_name, write, mode)
+        finally:
+            for stream, _ in opened:
+                if stream is not None:
+                    stream.close()
+
+        st = os.stat(manuf_name)
+        state = {"mtime_ns": st.st_mtime_ns, "size": st.st_size,
+                 "sources": dict((source, v) for (_, source), (_, v) in zip(sources, opened))}
+        _write_atomic(state_name, lambda f: f.write(json.dumps(state, indent=4).encode("utf-8")))
+
+        if refresh:
+            self.refresh(manuf_name)
+        return True
 
-        response.close()
-        if not wfa_url:
-            wfa_url = self.WFA_URL
+    @staticmethod
+    def _open_source(label, source, validators):
+        """Opens a database source, unless it did not change since its validators were recorded.
+
+        Returns:
+            The binary stream of the source and its validators, or (None, validators) if the
+            source did not change.
 
-        # Append WFA to new database
+        """
+        if "://" not in source:
+            st = os.stat(source)
+            current = {"mtime_ns": st.st_mtime_ns, "size": st.st_size}
+            if current == validators:
+                return None, validators
+            return io.open(source, "rb"), current
+
+        request = Request(source)
+        if validators:
+            if validators.get("etag"):
+                request.add_header("If-None-Match", validators["etag"])
+            if validators.get("last_modified"):
+                request.add_header("If-Modified-Since", validators["last_modified"])
         try:
-            response = urlopen(wfa_url)
+            response = urlopen(request)
+        except HTTPError as e:
+            if e.code == 304:
+                return None, validators
+            raise URLError("Failed downloading {0} database: {1} {2}".format(label, e.code, e.msg))
         except URLError:
-            raise URLError("Failed downloading WFA database")
-
-        # Parse the response
-        if response.code == 200:
-            with open(manuf_name, "ab") as write_file:
-                write_file.write(response.read())
-            if refresh:
-                self.refresh(manuf_name)
-        else:
-            err = "{0} {1}".format(response.code, response.msg)
-            raise URLError("Failed downloading database: {0}".format(err))
+            raise URLError("Failed downloading {0} database".format(label))
 
-        response.close()
+        current = {"etag": response.headers.get("ETag"), "last_modified": response.headers.get("Last-Modified")}
+        # some servers ignore conditional requests
+        if validators and (current["etag"] or current["last_modified"]) and current == validators:
+            response.close()
+            return None, validators
+        return response, current
 
     def search(self, mac, maximum=1):
         """Search for multiple Vendor tuples possibly matching a MAC address.
@@ -190,20 +668,142 @@ class MacParser(object):
             ValueError: If the MAC could not be parsed.
 
         """
-        vendors = []
         if maximum <= 0 or not mac:
-            return vendors
+            return []
         mac_str = self._strip_mac(mac)
         mac_int = self._get_mac_int(mac_str)
+        return self._lookup().search(mac_int, self._bits_left(mac_str), maximum)
 
-        # If the user only gave us X bits, check X bits. No partial matching!
-        for mask in range(self._bits_left(mac_str), 48):
-            result = self._masks.get((mask, mac_int >> mask))
-            if result:
-                vendors.append(result)
-                if len(vendors) >= maximum:
-                    break
-        return vendors
+    def search_many(self, macs, maximum=1, strict=True):
+        """Search for the Vendor tuples possibly matching each MAC address of a batch.
+
+        The addresses are parsed once, then resolved together with one pass per mask length
+        present in the database. Repeated addresses are only searched once.
+
+        Args:
+            macs (iterable): MAC addresses in standard format.
+            maximum (int): Maximum results to return per address. Defaults to 1.
+            strict (bool): Whether to raise on an invalid address, rather than return no
+                result for it. Defaults to True.
+
+        Returns:
+            List of lists of Vendor namedtuples, aligned with the input, closest result first.
+
+        Raises:
+            ValueError: If a MAC could not be parsed and strict is set.
+
+        """
+        parsed, results = self._search_many(macs, maximum, strict)
+        if maximum == 1:
+            vendors = [results[entry[1]].get(entry[0]) if entry is not None else None for entry in parsed]
+            return [[vendor] if vendor is not None else [] for vendor in vendors]
+        return [list(results[entry[1]].get(entry[0], ())) if entry is not None else [] for entry in parsed]
+
+    def _search_many(self, macs, maximum, strict):
+        """Parses and resolves a batch of MAC addresses.
+
+        Returns:
+            The (mac_int, bits_left) tuple of each address, None if it is empty or invalid, and
+            a dict bits_left -> mac_int -> list of Vendor namedtuples (the Vendor or None when
+            maximum is 1).
+
+        """
+        # same characters as _pattern, without the cost of a regular expression per address
+        mac_strs = [mac.replace("-", "").replace(":", "").replace(".", "") if mac else None for mac in macs]
+        try:
+            parsed = [None if mac_str is None else (int(mac_str, 16) << (48 - 4 * len(mac_str)), 48 - 4 * len(mac_str))
+                      for mac_str in mac_strs]
+        except ValueError:
+            parsed = []
+            for mac_str in mac_strs:
+                entry = None
+                if mac_str is not None:
+                    try:
+                        entry = (self._get_mac_int(mac_str), self._bits_left(mac_str))
+                    except ValueError:
+                        if strict:
+                            raise
+                parsed.append(entry)
+
+        if maximum <= 0:
+            return parsed, dict((entry[1], {}) for entry in parsed if entry is not None)
+
+        # addresses with the same number of bits are eligible for the same mask lengths
+        entries = set(parsed)
+        entries.discard(None)
+        bits = set(bits_left for _, bits_left in entries)
+        if len(bits) == 1:
+            groups = { bits.pop(): [mac_int for mac_int, _ in entries] }
+        else:
+            groups = {}
+            for mac_int, bits_left in entries:
+                groups.setdefault(bits_left, []).append(mac_int)
+        results = dict((bits_left, self._search_group(mac_ints, bits_left, maximum))
+                       for bits_left, mac_ints in groups.items())
+        return parsed, results
+
+    def _search_group(self, mac_ints, bits_left, maximum):
+        lookup = self._lookup()
+        mask_lengths = lookup.mask_lengths()
+        lookup_many = lookup.lookup_many
+
+        # mac_int -> vendors found, closest first, or the closest vendor (None if not found yet)
+        results = {}
+        pending = mac_ints
+        for mask in mask_lengths:
+            if not pending:
+                break
+            if mask < bits_left:
+                continue
+            found = lookup_many(mask, [mac_int >> mask for mac_int in pending])
+            if maximum == 1:
+                results.update(zip(pending, found))
+                pending = [mac_int for mac_int, vendor in zip(pending, found) if vendor is None]
+            else:
+                for mac_int, vendor in zip(pending, found):
+                    if vendor is not None:
+                        results.setdefault(mac_int, []).append(vendor)
+                pending = [mac_int for mac_int, vendor in zip(pending, found)
+                           if vendor is None or len(results[mac_int]) < maximum]
+        return results
+
+    def get_all_many(self, macs, strict=True):
+        """Get the Vendor tuples of a batch of MAC addresses.
+
+        Args:
+            macs (iterable): MAC addresses in standard format.
+            strict (bool): Whether to raise on an invalid address. Defaults to True.
+
+        Returns:
+            List of Vendor namedtuples aligned with the input. Fields are None if not found.
+
+        Raises:
+            ValueError: If a MAC could not be parsed and strict is set.
+
+        """
+        return self._first_vendors(*self._search_many(macs, 1, strict))
+
+    @staticmethod
+    def _first_vendors(parsed, results):
+        none = Vendor(manuf=None, manuf_long=None, comment=None)
+        vendors = [results[entry[1]].get(entry[0]) if entry is not None else None for entry in parsed]
+        return [vendor or none for vendor in vendors]
+
+    def get_manuf_many(self, macs, strict=True):
+        """Returns the manufacturers of a batch of MAC addresses.
+
+        Args:
+            macs (iterable): MAC addresses in standard format.
+            strict (bool): Whether to raise on an invalid address. Defaults to True.
+
+        Returns:
+            List of strings aligned with the input, None where not found.
+
+        Raises:
+            ValueError: If a MAC could not be parsed and strict is set.
+
+        """
+        return [vendor.manuf for vendor in self.get_all_many(macs, strict=strict)]
 
     def get_all(self, mac):
         """Get a Vendor tuple containing (manuf, comment) from a MAC address.
@@ -304,6 +904,62 @@ class MacParser(object):
         return manuf_file_path
 
 
+def lookup_stream(parser, lines, output, output_format="tsv", column=None, batch_size=50000):
+    """Resolves the MAC addresses read from lines of text, by batches.
+
+    Args:
+        parser (MacParser): Parser to use.
+        lines (iterable): Lines of text, one MAC address per line.
+        output (file): Text stream to write the results to.
+        output_format (str): "tsv" (address, manuf, long name and comment separated by tabs)
+            or "ndjson" (one JSON object per line).
+        column (int): Take the address from this whitespace-separated field of each line
+            (1 for the first one) instead of the whole line.
+        batch_size (int): Number of addresses resolved together.
+
+    Returns:
+        int: Number of addresses that could not be parsed. They are written with empty fields.
+
+    """
+    if output_format == "ndjson":
+        encode = json.encoder.encode_basestring_ascii
+        macs_out = lambda macs: ['{"mac": ' + encode(mac) for mac in macs]
+        format_vendor = lambda v: ', "manuf": %s, "manuf_long": %s, "comment": %s}' % tuple(json.dumps(f) for f in v)
+    else:
+        macs_out = lambda macs: macs
+        format_vendor = lambda v: "\t" + "\t".join(f or "" for f in v)
+
+    suffixes = {}
+
+    def suffix(vendor):
+        suffixes[vendor] = format_vendor(vendor)
+        return suffixes[vendor]
+
+    invalid = 0
+    lines = iter(lines)
+    while True:
+        batch = list(itertools.islice(lines, batch_size))
+        if not batch:
+            break
+
+        if column is None:
+            macs = [line.strip() for line in batch]
+        else:
+            fields = [line.split() for line in batch]
+            macs = [f[column - 1] if len(f) >= column else "" for f in fields]
+
+        parsed, results = parser._search_many(macs, 1, False)
+        vendors = parser._first_vendors(parsed, results)
+        invalid += sum(1 for mac, entry in zip(macs, parsed) if entry is None and mac)
+
+        # the fields of a vendor are formatted once
+        out = [mac + (suffixes.get(vendor) or suffix(vendor)) for mac, vendor in zip(macs_out(macs), vendors)]
+        out.append("")
+        output.write("\n".join(out))
+
+    return invalid
+
+
 def main(*input_args):
     """Simple command line wrapping for MacParser."""
     argparser = argparse.ArgumentParser(description="Parser utility for Wireshark's OUI database.")
@@ -313,17 +969,58 @@ def main(*input_args):
                            default=None)
 
     argparser.add_argument("-u", "--update",
-                           help="update manuf file from the internet",
+                           help="update manuf file from the internet, if it changed",
                            action="store_true")
+    argparser.add_argument("--manuf-url",
+                           help="URL or local path of the OUI database used by --update",
+                           default=None)
+    argparser.add_argument("--wfa-url",
+                           help="URL or local path of the WFA database used by --update",
+                           default=None)
+    argparser.add_argument("-i", "--input",
+                           help="file of MAC addresses, one per line (- for stdin, default when stdin is not a terminal)",
+                           action="append",
+                           default=[])
+    argparser.add_argument("-f", "--format",
+                           help="output format of the addresses read from files",
+                           choices=["tsv", "ndjson"],
+                           default="tsv")
+    argparser.add_argument("-c", "--column",
+                           help="take the address from this whitespace-separated field of each line",
+                           type=int,
+                           default=None)
+    argparser.add_argument("-b", "--batch",
+                           help="number of addresses resolved together",
+                           type=int,
+                           default=50000)
     argparser.add_argument("mac_address", nargs='?', help="MAC address to check")
 
     input_args = input_args or None  # if main is called with explicit args parse these - else use sysargs
     args = argparser.parse_args(args=input_args)
-    parser = MacParser(manuf_name=args.manuf, update=args.update)
+    parser = MacParser(manuf_name=args.manuf)
+    if args.update:
+        if parser.update(manuf_url=args.manuf_url, wfa_url=args.wfa_url):
+            print("manuf file updated", file=sys.stderr)
+        else:
+            print("manuf file up to date", file=sys.stderr)
 
     if args.mac_address:
         print(parser.get_all(args.mac_address))
 
+    inputs = args.input
+    if not inputs and not args.mac_address and not args.update and not sys.stdin.isatty():
+        inputs = ["-"]
+
+    invalid = 0
+    for name in inputs:
+        if name == "-":
+            invalid += lookup_stream(parser, sys.stdin, sys.stdout, args.format, args.column, max(1, args.batch))
+        else:
+            with io.open(name, "r", encoding="utf-8", errors="replace") as f:
+                invalid += lookup_stream(parser, f, sys.stdout, args.format, args.column, max(1, args.batch))
+    if invalid:
+        print("{0} invalid MAC addresses".format(invalid), file=sys.stderr)
+
     sys.exit(0)
 
 if __name__ == "__main__":
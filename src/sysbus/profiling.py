@@ -0,0 +1,215 @@
+#! /usr/bin/env python3
+# -*- encoding: utf-8 -*-
+# vim:set ts=4 sw=4 et:
+
+"""
+profilage d'une commande sysbus (--profile)
+
+Le démarrage (imports et analyse des options) et la configuration avec l'authentification sont
+chronométrés. La commande elle-même est exécutée sous cProfile: le temps propre de chaque fonction
+est classé en imports différés, attente réseau, décodage JSON, mise en forme et sortie, ou autre.
+
+Les requêtes parallèles sont exécutées dans des threads: le thread principal les attend (compté en
+attente réseau), leur propre profil est résumé à part et ajouté au fichier pstats.
+"""
+
+import sys
+import os
+import time
+import threading
+import cProfile
+import pstats
+
+
+##
+# @brief catégories du temps de la commande, dans l'ordre d'affichage
+CATEGORIES = ("import", "réseau", "json", "sortie", "autre")
+
+LIBELLES = { "import": "imports différés", "réseau": "attente réseau", "json": "décodage JSON",
+             "sortie": "mise en forme et sortie", "autre": "autre" }
+
+##
+# @brief règles de classement: fragments de chemin des modules, ou de nom des fonctions natives
+REGLES = {
+    # modules chargés à la demande (requests, graphviz...): chargement, compilation des expressions régulières
+    "import": ( "<frozen importlib", "<frozen zipimport", "marshal.loads", "builtins.compile", "builtins.__import__",
+                "_imp.", "re/_compiler.py", "re/_parser.py", "re/__init__.py", "sre_compile.py", "sre_parse.py" ),
+    "réseau": ( "socket.py", "ssl.py", "selectors.py", "http/client.py", "/urllib3/", "/requests/",
+                "/asyncio/", "/concurrent/futures/", "threading.py", "queue.py",
+                "_socket.", "select.", "_ssl.", "_thread.lock", "_thread.RLock", "_queue.", "time.sleep" ),
+    "json":   ( "json/decoder.py", "json/__init__.py", "_json.scanstring", "raw_decode",
+                "_codecs.utf_8_decode", "codecs.py", "'decode' of 'bytes'" ),
+    "sortie": ( "json/encoder.py", "_json.encode", "pprint.py", "html/__init__.py", "/graphviz/", "/qrcode/",
+                "builtins.print", "'write' of '_io.", "'flush' of '_io.", "'format' of 'str'", "gzip.py" ),
+}
+
+##
+# @brief fonctions de sysbus classées explicitement
+FONCTIONS = {
+    "réseau": ( "envoie_requete", "requete_partagee", "charge_ws", "requetes", "requetes_async", "requete_async",
+                "crawl_model", "crawl_model_async" ),
+    "json":   ( "iter_json", "filtre_octets", "decode_reponse" ),
+    "sortie": ( "model", "print_functions", "print_parameters", "requete_print", "_build_node", "progression",
+                "traverse", "MIBs_table_rep" ),
+}
+
+
+##
+# @brief catégorie du temps propre d'une fonction
+#
+# @param cle (fichier, ligne, fonction) de pstats
+# @param appelants appelants de pstats: une fonction native non classée prend la catégorie de son
+#                  principal appelant (posix.stat pendant les imports par exemple)
+#
+# @return
+def categorie(cle, appelants=None):
+    fichier, _, fonction = cle
+    if fichier == "~" and appelants:
+        cat = categorie(cle)
+        if cat != "autre":
+            return cat
+        return categorie(max(appelants, key=lambda a: appelants[a][2]))
+
+    # corps d'un module exécuté à son import
+    if fonction == "<module>":
+        return "import"
+    if fichier.endswith("sysbus.py"):
+        for cat, noms in FONCTIONS.items():
+            if fonction in noms:
+                return cat
+        # le corps des commandes met en forme les résultats
+        if fonction.endswith("_cmd"):
+            return "sortie"
+        return "autre"
+
+    texte = fonction if fichier == "~" else fichier.replace(os.sep, "/")
+    for cat, fragments in REGLES.items():
+        if any(f in texte for f in fragments):
+            return cat
+    return "autre"
+
+
+##
+# @brief temps propre par catégorie
+#
+# @param stats pstats.Stats
+#
+# @return dict catégorie -> secondes
+def repartition(stats):
+    r = dict.fromkeys(CATEGORIES, 0.)
+    for cle, (_, _, tt, _, appelants) in stats.stats.items():
+        r[categorie(cle, appelants)] += tt
+    return r
+
+
+##
+# @brief profilage d'une exécution de sysbus
+class Profil:
+
+    ##
+    # @param debut_import instant (perf_counter) du début du chargement de sysbus, None si inconnu
+    def __init__(self, debut_import=None):
+        self.debut_import = debut_import
+        self.debut = time.perf_counter()
+        self.debut_commande = None
+        self.fin = None
+        self.profil = cProfile.Profile()
+        self.threads = []
+        self.verrou = threading.Lock()
+
+    ##
+    # @brief profile les threads créés à partir de maintenant (requêtes parallèles)
+    #        depuis Python 3.12, cProfile ne peut plus être activé par thread
+    #
+    # @return
+    def _thread(self, frame, event, arg):
+        p = cProfile.Profile()
+        try:
+            p.enable()
+        except ValueError:
+            return
+        with self.verrou:
+            self.threads.append(p)
+
+    ##
+    # @brief fin de la configuration et de l'authentification: début de la commande
+    #
+    # @return
+    def commande(self):
+        if self.debut_commande is not None:
+            return
+        self.debut_commande = time.perf_counter()
+        if sys.version_info < (3, 12):
+            threading.setprofile(self._thread)
+        self.profil.enable()
+
+    ##
+    # @brief arrête le profilage, affiche le rapport et sauve éventuellement les statistiques
+    #
+    # @param fichier fichier pstats, ou None
+    # @param f flux du rapport
+    #
+    # @return
+    def termine(self, fichier=None, f=None):
+        self.fin = time.perf_counter()
+        if self.debut_commande is None:
+            self.debut_commande = self.fin
+        else:
+            self.profil.disable()
+            threading.setprofile(None)
+        for p in self.threads:
+            p.disable()
+
+        f = f or sys.stderr
+        stats = pstats.Stats(self.profil, stream=f)
+        stats_threads = None
+        if self.threads:
+            stats_threads = pstats.Stats(*self.threads, stream=f)
+
+        self.rapport(stats, stats_threads, f)
+
+        if fichier:
+            if stats_threads is not None:
+                stats.add(stats_threads)
+            stats.dump_stats(fichier)
+            print("statistiques écrites dans %s (python3 -m pstats, snakeviz, flameprof...)" % fichier, file=f)
+
+    ##
+    # @brief affiche la répartition du temps et les fonctions les plus coûteuses
+    #
+    # @param stats
+    # @param stats_threads
+    # @param f
+    #
+    # @return
+    def rapport(self, stats, stats_threads, f):
+        demarrage = self.debut - self.debut_import if self.debut_import is not None else 0.
+        config = self.debut_commande - self.debut
+        commande = self.fin - self.debut_commande
+        total = demarrage + config + commande
+
+        pct = lambda t: t * 100. / total if total > 0 else 0.
+        print("", file=f)
+        print("profil: %.3f s" % total, file=f)
+        print("  %-36s %8.3f s %5.1f%%" % ("démarrage (imports, options)", demarrage, pct(demarrage)), file=f)
+        print("  %-36s %8.3f s %5.1f%%" % ("configuration et authentification", config, pct(config)), file=f)
+        print("  %-36s %8.3f s %5.1f%%" % ("commande", commande, pct(commande)), file=f)
+
+        # temps propre des fonctions ramené à la durée de la commande (le profilage la rallonge)
+        r = repartition(stats)
+        profile = sum(r.values())
+        for cat in CATEGORIES:
+            t = r[cat] * commande / profile if profile > 0 else 0.
+            print("    %-34s %8.3f s %5.1f%%" % (LIBELLES[cat], t, pct(t)), file=f)
+
+        if stats_threads is not None:
+            r = repartition(stats_threads)
+            print("  threads des requêtes parallèles (temps cumulé): " +
+                  ", ".join("%s %.3f s" % (LIBELLES[cat], r[cat]) for cat in CATEGORIES), file=f)
+
+        print("", file=f)
+        print("fonctions les plus coûteuses (temps propre, thread principal):", file=f)
+        lignes = sorted(stats.stats.items(), key=lambda s: -s[1][2])[:15]
+        for (fichier, ligne, fonction), (_, nc, tt, ct, appelants) in lignes:
+            nom = fonction if fichier == "~" else "%s:%d(%s)" % (os.path.basename(fichier), ligne, fonction)
+            print("  %8.3f s %8.3f s %8d  %-6s %s" % (tt, ct, nc, categorie((fichier, ligne, fonction), appelants), nom), file=f)
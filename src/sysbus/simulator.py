@@ -0,0 +1,681 @@
+#! /usr/bin/env python3
+# -*- encoding: utf-8 -*-
+# vim:set ts=4 sw=4 et:
+
+"""
+simulateur de Livebox: serveur HTTP local qui répond aux requêtes de sysbus
+
+Le simulateur sert les données enregistrées par sysbus lors d'un dump (sysbus -dump):
+    model.json[.gz]                 datamodel complet (-modelraw)
+    mibs/<intf>.dict                datamodel de NeMo.Intf.<intf> (-MIBs dump)
+    mibs/<intf>.mib                 MIBs de l'interface (-MIBs dump)
+    ws/<service>:<méthode>.json     réponse d'un appel, ex: ws/Hosts.Host:get.json = {"status": ...}
+    scripts.js, version.txt...      fichiers statiques
+
+ou un datamodel synthétique (--synthetic) quand il n'y a pas d'enregistrement.
+
+Requêtes simulées:
+    POST /ws                        createContext (lb4) et appels service/méthode
+    POST /authenticate              authentification des lb2/lb3
+    POST /sysbus/<objet>:<méthode>  ancienne API
+    GET /sysbus/<objet>?_restDepth= datamodel
+    GET /_stats                     compteurs du simulateur (?reset=1 pour les remettre à zéro),
+                                    first: date d'arrivée de la première requête (time.time())
+
+La latence, le temps de sérialisation d'une vraie Livebox, son débit et le nombre de
+requêtes qu'elle traite simultanément sont paramétrables.
+
+usage: python3 -m sysbus.simulator [-d FIXTURES | --synthetic N] [--latency MS] ...
+"""
+
+import sys
+import os
+import re
+import json
+import gzip
+import time
+import uuid
+import random
+import socket
+import argparse
+import threading
+import socketserver
+import http.server
+import urllib.parse
+
+
+##
+# @brief erreur renvoyée pour un contexte absent, invalide ou expiré
+ERREUR_CONTEXTE = { "status": None, "errors": [ { "error": 13, "description": "Permission denied", "info": "" } ] }
+
+
+##
+# @brief méthodes de simple lecture (même règle que misc/getws.sh)
+def methode_lecture(methode):
+    return re.match(r'(get|list|has|retrieve|logEvents)', methode) is not None
+
+
+##
+# @brief lit des documents JSON concaténés ('{...}{...}')
+#
+# @param texte
+#
+# @return liste des documents
+def documents_json(texte):
+    decoder = json.JSONDecoder()
+    espaces = re.compile(r'[\s,]*')
+    docs = []
+    pos = espaces.match(texte, 0).end()
+    while pos < len(texte):
+        doc, pos = decoder.raw_decode(texte, pos)
+        docs.append(doc)
+        pos = espaces.match(texte, pos).end()
+    return docs
+
+
+##
+# @brief valeur Python d'un paramètre du datamodel
+#
+# @param p
+#
+# @return
+def valeur_parametre(p):
+    v = p.get('value')
+    if p.get('type') == 'bool':
+        return str(v).lower() == "true"
+    if p.get('type') in ('int32', 'uint32', 'int64', 'uint64') and v is not None:
+        try:
+            return int(v)
+        except ValueError:
+            pass
+    return v
+
+
+##
+# @brief copie d'un noeud limitée à prof niveaux (-1: tout le sous-arbre)
+#
+# @param node
+# @param prof
+#
+# @return
+def tronque(node, prof):
+    if prof < 0:
+        return node
+    n = dict(node)
+    for liste in ('children', 'instances'):
+        if liste in n:
+            n[liste] = [ tronque(c, prof - 1) for c in n[liste] ] if prof > 0 else []
+    return n
+
+
+##
+# @brief données servies par le simulateur
+class Fixtures:
+
+    def __init__(self):
+        self.racine = []        # documents du datamodel
+        self.objets = {}        # "NeMo.Intf.lan" -> noeud
+        self.mibs = {}          # interface -> { mib: valeur }
+        self.ws = {}            # "service:méthode" -> résultat
+        self.fichiers = None    # répertoire des fichiers statiques
+
+    ##
+    # @brief ajoute les noeuds d'un datamodel à l'index des objets
+    #
+    # @param node
+    #
+    # @return
+    def indexe(self, node):
+        o = node.get('objectInfo')
+        if o is not None and o.get('key'):
+            chemin = (o['keyPath'] + "." if o.get('keyPath') else "") + o['key']
+            self.objets.setdefault(chemin, node)
+        for liste in ('children', 'instances'):
+            for c in node.get(liste) or []:
+                self.indexe(c)
+
+    ##
+    # @brief charge un répertoire d'enregistrements
+    #
+    # @param d
+    #
+    # @return
+    @classmethod
+    def charge(cls, d):
+        f = cls()
+        f.fichiers = d
+
+        for nom, ouvre in (("model.json", open), ("model.json.gz", gzip.open)):
+            chemin = os.path.join(d, nom)
+            if os.path.exists(chemin):
+                with ouvre(chemin, "rb") as fp:
+                    f.racine = documents_json(fp.read().decode('utf-8', errors='replace'))
+                break
+
+        for node in f.racine:
+            f.indexe(node)
+
+        mibs = os.path.join(d, "mibs")
+        if os.path.isdir(mibs):
+            for nom in sorted(os.listdir(mibs)):
+                intf, ext = os.path.splitext(nom)
+                if ext not in (".dict", ".mib"):
+                    continue
+                with open(os.path.join(mibs, nom)) as fp:
+                    r = json.load(fp)
+                if ext == ".dict":
+                    # complète le datamodel si model.json est absent ou partiel
+                    for node in r:
+                        f.indexe(node)
+                elif ext == ".mib":
+                    for m, v in (r.get('status') or {}).items():
+                        f.mibs.setdefault(intf, {})[m] = v.get(intf, {})
+
+        ws = os.path.join(d, "ws")
+        if os.path.isdir(ws):
+            for nom in sorted(os.listdir(ws)):
+                if nom.endswith(".json"):
+                    with open(os.path.join(ws, nom)) as fp:
+                        f.ws[nom[:-5]] = json.load(fp)
+
+        return f
+
+    ##
+    # @brief génère une Livebox synthétique
+    #
+    # @param objets nombre d'objets du datamodel
+    # @param intfs nombre d'interfaces NeMo
+    # @param hotes nombre d'équipements connectés
+    # @param graine
+    #
+    # @return
+    @classmethod
+    def synthetique(cls, objets=2000, intfs=40, hotes=30, graine=1):
+        f = cls()
+        alea = random.Random(graine)
+
+        def noeud(keypath, key, parametres, fonctions=("get", "set"), instance=False):
+            return { "objectInfo": { "keyPath": keypath, "key": key, "name": key,
+                                     "indexPath": keypath, "indexKey": key, "state": "ready",
+                                     "attributes": { "instance": instance, "persistent": True } },
+                     "parameters": [ { "name": n, "type": t, "value": v,
+                                       "attributes": { "persistent": True, "read_only": alea.random() < 0.3 } }
+                                     for n, t, v in parametres ],
+                     "functions": [ { "name": n, "type": "variant",
+                                      "arguments": [ { "name": "parameters", "type": "variant",
+                                                       "attributes": { "in": True, "mandatory": False } } ],
+                                      "attributes": {} }
+                                    for n in fonctions ],
+                     "children": [], "instances": [], "errors": [] }
+
+        def parametres(n):
+            p = []
+            for k in range(n):
+                t = alea.choice(("string", "bool", "uint32"))
+                if t == "string":
+                    v = "".join(alea.choice("abcdefghijklmnopqrstuvwxyz0123456789") for _ in range(alea.randint(0, 24)))
+                elif t == "bool":
+                    v = alea.choice(("true", "false"))
+                else:
+                    v = str(alea.randint(0, 100000))
+                p.append(("Param%d" % k, t, v))
+            return p
+
+        def mac(k):
+            return "00:1A:2B:%02X:%02X:%02X" % ((k >> 16) & 255, (k >> 8) & 255, k & 255)
+
+        # les objets utilisés par les commandes de sysbus
+        info = noeud("", "DeviceInfo", [ ("Manufacturer", "string", "Sagemcom"), ("ModelName", "string", "SagemcomFast3965_LB2.8"),
+                                        ("SoftwareVersion", "string", "SG30_sip-fr-6.62.12.1"), ("UpTime", "uint32", "123456"),
+                                        ("ExternalIPAddress", "string", "192.0.2.1"), ("NumberOfReboots", "uint32", "12") ])
+        heure = noeud("", "Time", [ ("LocalTimeZoneName", "string", "Europe/Paris") ], ("getTime", "getLocalTimeZoneName"))
+
+        hote = noeud("", "Hosts", [ ("HostNumberOfEntries", "uint32", str(hotes)) ])
+        host = noeud("Hosts", "Host", [], ("get",))
+        hote['children'].append(host)
+        hosts = {}
+        for k in range(1, hotes + 1):
+            h = { "MACAddress": mac(k), "InterfaceType": alea.choice(("Ethernet", "802.11")), "Active": alea.random() < 0.7,
+                  "HostName": "hote-%d" % k, "IPAddress": "192.168.1.%d" % (10 + k % 240) }
+            hosts[str(k)] = h
+            host['instances'].append(noeud("Hosts.Host", str(k), [ (n, "bool" if n == "Active" else "string", str(v).lower() if n == "Active" else v)
+                                                                  for n, v in h.items() ], (), instance=True))
+
+        nemo = noeud("", "NeMo", [])
+        intf = noeud("NeMo", "Intf", [], ())
+        nemo['children'].append(intf)
+        noms = [ "lo", "lan", "data", "wl0", "wl1", "eth0", "eth1", "eth2", "eth3", "bridge" ]
+        noms += [ "intf%d" % k for k in range(max(0, intfs - len(noms))) ]
+        noms = noms[:intfs]
+        liste_mibs = [ "alias", "base", "bridge", "copy", "dhcp", "dsl", "eth", "ip", "llintfs", "netdev",
+                       "penable", "ppp", "ptswitch", "switch", "ulintfs", "vlan", "wlanradio", "wlanvap" ]
+        # graphe des interfaces: liens vers les couches basses (LLIntf) et hautes (ULIntf), tirés avec
+        # un générateur à part pour ne pas changer le reste du datamodel
+        liens = random.Random(graine + 1)
+        basses = { i: liens.sample(noms[k + 1:], min(len(noms) - k - 1, liens.randint(0, 2))) if i != "lo" else []
+                   for k, i in enumerate(noms) }
+        hautes = { i: [ j for j in noms if i in basses[j] ] for i in noms }
+        for i in noms:
+            actif = "true" if liens.random() < 0.9 else "false"
+            p = [ ("Name", "string", i), ("Enable", "bool", actif), ("Status", "bool", alea.choice(("true", "false"))),
+                  ("Flags", "string", " ".join(alea.sample(liste_mibs, 4))) ] + parametres(12)
+            intf['children'].append(noeud("NeMo.Intf", i, p, ("get", "getMIBs", "getIntfs", "setFirstParameter")))
+            f.mibs[i] = {}
+            for m in alea.sample(liste_mibs, alea.randint(2, 8)):
+                f.mibs[i][m] = {} if alea.random() < 0.2 else { n: valeur_parametre({ "type": t, "value": v }) for n, t, v in parametres(6) }
+            # la MIB base existe sur toutes les interfaces, avec la même forme que sur une vraie Livebox
+            f.mibs[i]["base"] = { "Name": i, "Enable": actif == "true", "Status": p[2][2] == "true", "Flags": p[3][2],
+                                  "LLIntf": { j: { "Name": j } for j in basses[i] },
+                                  "ULIntf": { j: { "Name": j } for j in hautes[i] } }
+
+        f.racine = [ info, heure, hote, nemo ]
+
+        # complète le datamodel avec des objets génériques
+        parents = []
+        for k in range(max(0, objets - len(f.racine) - len(intf['children']) - hotes - 3)):
+            if not parents or alea.random() < 0.1:
+                n = noeud("", "Objet%03d" % len(f.racine), parametres(8))
+                f.racine.append(n)
+            else:
+                p = alea.choice(parents[-50:])
+                o = p['objectInfo']
+                n = noeud((o['keyPath'] + "." if o['keyPath'] else "") + o['key'], "Sous%d" % len(p['children']), parametres(8))
+                if alea.random() < 0.02:
+                    n['errors'].append({ "error": 13, "info": "Secret", "description": "Permission denied" })
+                p['children'].append(n)
+            parents.append(n)
+
+        for node in f.racine:
+            f.indexe(node)
+
+        f.ws["Hosts.Host:get"] = { "status": hosts }
+        f.ws["Devices:get"] = { "status": [ { "Index": k, "Name": h['HostName'], "Active": h['Active'], "IPAddress": h['IPAddress'],
+                                              "IPv6Address": [ { "Address": "2001:db8::%x" % k, "Scope": "global" } ] }
+                                            for k, h in enumerate(hosts.values(), 1) ] }
+        f.ws["Devices.Device.HGW:topology"] = { "status": [ {
+            "Key": "00:1A:2B:00:00:00", "Name": "livebox", "Active": True, "DeviceType": "SAH HGW", "Index": "0",
+            "Children": [ { "Key": h['MACAddress'], "Name": h['HostName'], "Active": h['Active'], "Index": str(k),
+                            "DeviceType": "Computer", "IPAddress": h['IPAddress'], "Children": [] }
+                          for k, h in enumerate(hosts.values(), 1) ] } ] }
+
+        return f
+
+    ##
+    # @brief résultat d'un appel service/méthode
+    #
+    # @param service
+    # @param methode
+    # @param parametres
+    #
+    # @return
+    def appel(self, service, methode, parametres):
+        r = self.ws.get(service + ":" + methode)
+        if r is not None:
+            return r
+
+        if service.startswith("NeMo.Intf.") and service[10:] in self.mibs:
+            intf = service[10:]
+            tous = parametres.get('traverse') == 'all'
+            if methode == "getMIBs":
+                filtre = set(str(parametres.get('mibs') or "").split())
+                status = {}
+                for i in (sorted(self.mibs) if tous else [ intf ]):
+                    for m, v in self.mibs[i].items():
+                        if not filtre or m in filtre:
+                            status.setdefault(m, {})[i] = v
+                return { "status": status }
+            if methode == "getIntfs":
+                return { "status": sorted(self.mibs) if tous else [ intf ] }
+
+        if service == "Time" and methode == "getTime":
+            return { "status": True, "data": { "time": time.strftime("%a, %d %b %Y %H:%M:%S GMT%z") } }
+
+        node = self.objets.get(service)
+        if node is not None and methode == "get":
+            status = { p['name']: valeur_parametre(p) for p in node.get('parameters') or [] }
+            for i in node.get('instances') or []:
+                status[i['objectInfo']['key']] = { p['name']: valeur_parametre(p) for p in i.get('parameters') or [] }
+            return { "status": status }
+
+        if methode_lecture(methode):
+            return { "status": None, "errors": [ { "error": 196618, "description": "Object or parameter not found",
+                                                   "info": service } ] }
+
+        # modification: acceptée sans effet
+        return { "status": True }
+
+    ##
+    # @brief documents d'un GET du datamodel
+    #
+    # @param chemin chemin pointé ("" pour la racine)
+    # @param prof
+    #
+    # @return liste des documents
+    def datamodel(self, chemin, prof):
+        if chemin == "":
+            return [ tronque(n, prof) for n in self.racine ]
+        node = self.objets.get(chemin)
+        if node is None:
+            return [ { "errors": [ { "error": 196618, "description": "Object or parameter not found", "info": chemin } ] } ]
+        return [ tronque(node, prof) ]
+
+
+##
+# @brief serveur HTTP multithreadé (ThreadingHTTPServer n'existe qu'à partir de Python 3.7)
+class Serveur(socketserver.ThreadingMixIn, http.server.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, adresse, fixtures, latence=0., cpu=0., debit=0, workers=4,
+                 contexte_ttl=None, utilisateur="admin", mot_de_passe="admin", verbosite=0):
+        super().__init__(adresse, Requete)
+        self.fixtures = fixtures
+        self.latence = latence                  # secondes par requête
+        self.cpu = cpu                          # secondes de sérialisation par Mo de réponse
+        self.debit = debit                      # octets par seconde, 0: illimité
+        self.workers = threading.BoundedSemaphore(max(1, workers))
+        self.contexte_ttl = contexte_ttl
+        self.utilisateur = utilisateur
+        self.mot_de_passe = mot_de_passe
+        self.verbosite = verbosite
+        self.contextes = {}                     # contextID -> (sessid, expiration)
+        self.verrou = threading.Lock()
+        self.stats_raz()
+
+    ##
+    # @brief remet les compteurs à zéro
+    #
+    # @return
+    def stats_raz(self):
+        self.stats = { "requests": 0, "bytes_in": 0, "bytes_out": 0, "contexts": 0, "calls": {}, "first": None }
+
+    ##
+    # @brief note l'arrivée de la première requête depuis la remise à zéro des compteurs
+    #
+    # @return
+    def arrivee(self):
+        if self.stats['first'] is None:
+            t = time.time()
+            with self.verrou:
+                if self.stats['first'] is None:
+                    self.stats['first'] = t
+
+    ##
+    # @brief compte une requête
+    #
+    # @param appel
+    # @param entree
+    # @param sortie
+    #
+    # @return
+    def compte(self, appel, entree, sortie):
+        with self.verrou:
+            s = self.stats
+            s['requests'] += 1
+            s['bytes_in'] += entree
+            s['bytes_out'] += sortie
+            s['calls'][appel] = s['calls'].get(appel, 0) + 1
+
+    ##
+    # @brief crée un contexte d'authentification
+    #
+    # @return (contextID, sessid)
+    def nouveau_contexte(self):
+        contexte, sessid = uuid.uuid4().hex, uuid.uuid4().hex
+        expiration = time.monotonic() + self.contexte_ttl if self.contexte_ttl else None
+        with self.verrou:
+            self.contextes[contexte] = (sessid, expiration)
+            self.stats['contexts'] += 1
+        return contexte, sessid
+
+    ##
+    # @brief vérifie le contexte et le cookie de session d'une requête
+    #
+    # @param contexte
+    # @param sessid
+    #
+    # @return
+    def contexte_valide(self, contexte, sessid):
+        with self.verrou:
+            c = self.contextes.get(contexte)
+            if c is None or c[0] != sessid:
+                return False
+            if c[1] is not None and time.monotonic() > c[1]:
+                del self.contextes[contexte]
+                return False
+            return True
+
+
+##
+# @brief traitement des requêtes HTTP
+class Requete(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server_version = "sysbus-simulator"
+
+    COOKIE = "sysbus/sessid"
+    BLOC = 16384
+
+    def setup(self):
+        super().setup()
+        # en-têtes et corps sont écrits séparément: sans TCP_NODELAY, les petites réponses
+        # seraient retardées par l'algorithme de Nagle
+        self.request.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_message(self, format, *args):
+        if self.server.verbosite:
+            sys.stderr.write("%s - %s\n" % (self.address_string(), format % args))
+
+    ##
+    # @brief envoie la réponse en simulant le temps de traitement et le débit de la Livebox
+    #
+    # @param corps
+    # @param code
+    # @param type_contenu
+    # @param entetes
+    #
+    # @return
+    def reponse(self, corps, code=200, type_contenu="application/x-sah-ws-1-call+json", entetes=()):
+        srv = self.server
+        with srv.workers:
+            attente = srv.latence + srv.cpu * len(corps) / 1048576.
+            if attente > 0:
+                time.sleep(attente)
+
+        self.send_response(code)
+        self.send_header("Content-Type", type_contenu)
+        self.send_header("Content-Length", str(len(corps)))
+        for k, v in entetes:
+            self.send_header(k, v)
+        self.end_headers()
+
+        if srv.debit > 0:
+            for i in range(0, len(corps), self.BLOC):
+                bloc = corps[i:i + self.BLOC]
+                self.wfile.write(bloc)
+                time.sleep(len(bloc) / srv.debit)
+        else:
+            self.wfile.write(corps)
+        return len(corps)
+
+    def json(self, obj, **kwargs):
+        return self.reponse(json.dumps(obj, separators=(',', ':')).encode('utf-8'), **kwargs)
+
+    ##
+    # @brief la requête porte-t-elle un contexte valide ?
+    #
+    # @return
+    def authentifie(self):
+        cookies = {}
+        for c in (self.headers.get("Cookie") or "").split(";"):
+            k, _, v = c.strip().partition("=")
+            cookies[k] = v
+        return self.server.contexte_valide(self.headers.get("X-Context"), cookies.get(self.COOKIE))
+
+    ##
+    # @brief répond à une demande d'authentification
+    #
+    # @param utilisateur
+    # @param mot_de_passe
+    #
+    # @return octets envoyés
+    def authentification(self, utilisateur, mot_de_passe):
+        srv = self.server
+        if utilisateur != srv.utilisateur or mot_de_passe != srv.mot_de_passe:
+            return self.json({ "status": None, "data": {},
+                               "errors": [ { "error": 13, "description": "Permission denied", "info": "login" } ] })
+        contexte, sessid = srv.nouveau_contexte()
+        return self.json({ "status": 0, "data": { "contextID": contexte, "username": utilisateur, "groups": "http,admin" } },
+                         entetes=[ ("Set-Cookie", "%s=%s; path=/" % (self.COOKIE, sessid)) ])
+
+    def do_POST(self):
+        self.server.arrivee()
+        u = urllib.parse.urlparse(self.path)
+        n = int(self.headers.get("Content-Length") or 0)
+        corps = self.rfile.read(n) if n else b''
+
+        if u.path == "/authenticate":
+            q = urllib.parse.parse_qs(u.query)
+            envoye = self.authentification(q.get('username', [""])[0], q.get('password', [""])[0])
+            self.server.compte("authenticate", n, envoye)
+            return
+
+        try:
+            data = json.loads(corps.decode('utf-8') or "{}")
+        except ValueError:
+            data = None
+        if not isinstance(data, dict):
+            self.server.compte("?", n, self.json({ "error": "bad request" }, code=400))
+            return
+
+        if u.path == "/ws":
+            service, methode = data.get('service', ""), data.get('method', "")
+        elif u.path.startswith("/sysbus/") and ":" in u.path:
+            service, _, methode = u.path[8:].replace("/", ".").rpartition(":")
+        else:
+            self.server.compte("?", n, self.json({ "error": "not found" }, code=404))
+            return
+        appel = service + ":" + methode
+
+        if methode == "createContext" and self.headers.get("Authorization") == "X-Sah-Login":
+            p = data.get('parameters') or {}
+            envoye = self.authentification(p.get('username'), p.get('password'))
+        elif not self.authentifie():
+            envoye = self.json({ "result": ERREUR_CONTEXTE })
+        else:
+            envoye = self.json({ "result": self.server.fixtures.appel(service, methode, data.get('parameters') or {}) })
+        self.server.compte(appel, n, envoye)
+
+    def do_GET(self):
+        u = urllib.parse.urlparse(self.path)
+        q = urllib.parse.parse_qs(u.query)
+        srv = self.server
+
+        if u.path == "/_stats":
+            with srv.verrou:
+                corps = json.dumps(srv.stats).encode('utf-8')
+                if q.get('reset'):
+                    srv.stats_raz()
+            # pas de latence pour les statistiques
+            self.send_response(200)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(corps)))
+            self.end_headers()
+            self.wfile.write(corps)
+            return
+
+        srv.arrivee()
+
+        if u.path == "/sysbus" or u.path.startswith("/sysbus/"):
+            if not self.authentifie():
+                srv.compte("GET", 0, self.json({ "result": ERREUR_CONTEXTE }))
+                return
+            # sysbus demande la racine avec /sysbus/sysbus
+            chemin = [ c for c in u.path.split("/") if c ][1:]
+            if chemin[:1] == [ "sysbus" ]:
+                chemin = chemin[1:]
+            chemin = ".".join(urllib.parse.unquote(c) for c in chemin)
+            try:
+                prof = int(q.get('_restDepth', ["-1"])[0])
+            except ValueError:
+                prof = -1
+            docs = srv.fixtures.datamodel(chemin, prof)
+            corps = b''.join(json.dumps(d, separators=(',', ':'), ensure_ascii=False).encode('utf-8') for d in docs)
+            srv.compte("GET", 0, self.reponse(corps, type_contenu="application/json"))
+            return
+
+        # fichiers statiques enregistrés (scripts.js, version.txt...)
+        d = srv.fixtures.fichiers
+        nom = os.path.normpath(urllib.parse.unquote(u.path)).lstrip("/")
+        chemin = os.path.join(d, nom) if d and nom and not nom.startswith("..") else None
+        if chemin and os.path.isfile(chemin):
+            with open(chemin, "rb") as fp:
+                srv.compte("GET", 0, self.reponse(fp.read(), type_contenu="application/octet-stream"))
+        else:
+            srv.compte("GET", 0, self.json({ "error": "not found" }, code=404))
+
+
+##
+# @brief lance le simulateur dans un thread
+#
+# @param fixtures
+# @param adresse
+# @param port 0 pour un port libre
+# @param options voir Serveur
+#
+# @return le serveur (url dans serveur.url, arrêt par serveur.shutdown())
+def demarre(fixtures, adresse="127.0.0.1", port=0, **options):
+    srv = Serveur((adresse, port), fixtures, **options)
+    srv.url = "http://%s:%d/" % srv.server_address[:2]
+    threading.Thread(target=srv.serve_forever, daemon=True).start()
+    return srv
+
+
+##
+# @brief point d'entrée
+#
+# @param argv
+#
+# @return
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='simulateur de Livebox pour sysbus')
+    parser.add_argument('-d', '--fixtures', help="répertoire des enregistrements (dump de sysbus -dump)")
+    parser.add_argument('--synthetic', help="datamodel synthétique de N objets", type=int, metavar="N", nargs='?', const=2000)
+    parser.add_argument('--intfs', help="nombre d'interfaces NeMo du datamodel synthétique", type=int, default=40)
+    parser.add_argument('--hosts', help="nombre d'équipements du datamodel synthétique", type=int, default=30)
+    parser.add_argument('--seed', help="graine du datamodel synthétique", type=int, default=1)
+    parser.add_argument('--bind', help="adresse d'écoute", default="127.0.0.1")
+    parser.add_argument('-p', '--port', help="port d'écoute (0: port libre)", type=int, default=8000)
+    parser.add_argument('--latency', help="latence par requête (ms)", type=float, default=0.)
+    parser.add_argument('--cpu', help="temps de sérialisation par Mo de réponse (ms)", type=float, default=0.)
+    parser.add_argument('--bandwidth', help="débit des réponses (Ko/s, 0: illimité)", type=float, default=0.)
+    parser.add_argument('--workers', help="requêtes traitées simultanément", type=int, default=4)
+    parser.add_argument('--context-ttl', help="durée de validité des contextes (s)", type=float)
+    parser.add_argument('--user', help="utilisateur", default="admin")
+    parser.add_argument('--password', help="mot de passe", default="admin")
+    parser.add_argument('-v', '--verbose', help="affiche les requêtes", action='count', default=0)
+    args = parser.parse_args(argv)
+
+    if args.fixtures:
+        fixtures = Fixtures.charge(args.fixtures)
+    else:
+        fixtures = Fixtures.synthetique(args.synthetic or 2000, args.intfs, args.hosts, args.seed)
+
+    srv = Serveur((args.bind, args.port), fixtures,
+                  latence=args.latency / 1000., cpu=args.cpu / 1000., debit=args.bandwidth * 1024,
+                  workers=args.workers, contexte_ttl=args.context_ttl,
+                  utilisateur=args.user, mot_de_passe=args.password, verbosite=args.verbose)
+
+    # la première ligne indique l'url, utile avec --port 0
+    print("simulateur Livebox: http://%s:%d/ (%d objets, %d interfaces)"
+          % (srv.server_address[0], srv.server_address[1], len(fixtures.objets), len(fixtures.mibs)), flush=True)
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
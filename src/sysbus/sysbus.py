@@ -4,24 +4,40 @@
 
 # René D. février 2016
 
+import time
+
+##
+# @brief début du chargement du module, pour mesurer le temps de démarrage (--profile)
+debut_import = time.perf_counter()
+
 import sys
 import os
 import shutil
 import re
 import argparse
-import pickle
 import json
 import pprint
 from collections import *
 import functools
+import itertools
+import codecs
 import tempfile
+import hashlib
+import contextlib
 import configparser
 import datetime
 import html
+import gzip
+import io
 import subprocess
-import pkg_resources
-from dateutil.tz import tz
-from dateutil import parser as parsedate
+import shlex
+import concurrent.futures
+import threading
+import socket
+try:
+    import fcntl
+except ImportError:
+    fcntl = None
 
 
 ##
@@ -37,37 +53,35 @@ if sys.stdout.encoding is None:
 
 
 ##
-# @brief fonction lambda pour afficher sur stderr
-error = functools.partial(print, file=sys.stderr)
+# @brief fonction lambda pour afficher sur stderr (résolu à l'appel, le démon redirige sys.stderr)
+error = lambda *args, **kwargs: print(*args, file=sys.stderr, **kwargs)
 
 
 ##
-# @brief requests n'est pas dans la distrib standard de Python3, d'où le traitement spécifique
-#        pour l'import de cette librairie
-try:
-    import requests
-    import requests.utils
-except ImportError as e:
-    error("erreur:", e)
-    error("Installez http://www.python-requests.org/ :")
-    print("   pip3 install requests")
-    print("ou bien (selon la version de tar) :")
-    print("   curl -sL https://api.github.com/repos/kennethreitz/requests/tarball/master | tar -xzf - --strip-components 1 '*/requests'")
-    print("   curl -sL https://api.github.com/repos/kennethreitz/requests/tarball/master | tar -xzf - --strip-components=1 --wildcards '*/requests'")
-    sys.exit(2)
+# @brief requests et les connexions instrumentées, chargés à la première requête (cf. load_requests)
+requests = None
+connexion = None
 
 
-# initialise la base de données OUI
-manuf_name = pkg_resources.resource_filename(__name__, "manuf")
+# le démon et son client léger
 try:
-    from .manuf import MacParser
-    mac_parser = MacParser(manuf_name)
+    from . import daemon
 except ImportError:
-    try:
-        from manuf import MacParser
-        mac_parser = MacParser(manuf_name)
-    except ImportError:
-        mac_parser = None
+    import daemon
+
+# instrumentation des requêtes et profilage
+try:
+    from . import tracing
+    from . import profiling
+except ImportError:
+    import tracing
+    import profiling
+
+
+##
+# @brief base de données OUI, livrée avec le module et chargée à la première utilisation (cf. get_mac_parser)
+manuf_name = os.path.join(os.path.dirname(os.path.abspath(__file__)), "manuf")
+mac_parser = None
 
 
 ##
@@ -82,12 +96,52 @@ VERSION_LIVEBOX = 'lb4'
 # @brief niveau de détail, -v pour l'augmenter
 verbosity = 0
 
+##
+# @brief profilage de la commande en cours (--profile)
+profil = None
+
+##
+# @brief nombre maximal de requêtes simultanées, -j ou --jobs pour le modifier
+JOBS = 8
+jobs = JOBS
+
 
 ##
 # @brief session requests et entêtes d'authentification
+#        la session est créée à la première requête envoyée (cf. get_session), avec les cookies du contexte
 session = None
+session_cookies = None
+session_lock = threading.Lock()
 sah_headers = None
 
+##
+# @brief Livebox et utilisateur de la session courante (le démon la réutilise d'une commande à l'autre)
+session_key = None
+
+##
+# @brief nombre de niveaux du datamodel récupérés par sous-arbres en parallèle (--crawl)
+crawl = None
+
+##
+# @brief vérifie le contexte avec Time:getTime dès l'authentification (--check-auth)
+#        sinon le contexte mémorisé est utilisé directement et renouvelé si une requête est refusée
+check_auth = False
+
+##
+# @brief numéro du contexte courant, incrémenté à chaque authentification
+#        (les requêtes simultanées refusées ne renouvellent le contexte qu'une seule fois)
+context_generation = 0
+auth_lock = threading.Lock()
+
+##
+# @brief numéro du contexte déjà accepté par la Livebox (créé par ce processus, ou qui a servi une
+#        requête): l'erreur 13 y est un vrai refus, pas une expiration
+contexte_confirme = None
+
+##
+# @brief contexte créé après une erreur 13, mémorisé seulement si la requête rejouée est acceptée
+etat_differe = None
+
 
 ##
 # @brief affiche un message de mise au point
@@ -245,95 +299,364 @@ def check_conf():
     sys.exit(2)
 
 
+##
+# @brief durée de vie maximale d'un contexte mémorisé (secondes)
+STATE_TTL = 24 * 3600
+
+
+##
+# @brief retourne le répertoire de cache de sysbus (sessions, réponses...), accessible uniquement
+#        par l'utilisateur
+#
+# @return
+def cache_dir():
+    d = os.path.join(os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache"), "sysbus")
+    os.makedirs(d, mode=0o700, exist_ok=True)
+    return d
+
+
 ##
 # @brief retourne le chemin du fichier de sauvegarde du cookie et contextID
+#        un fichier par Livebox, utilisateur et modèle
 #
 # @return
 def state_file():
-    return tempfile.gettempdir() + "/" + "sysbus_state"
+    key = "\n".join([URL_LIVEBOX, USER_LIVEBOX, VERSION_LIVEBOX])
+    return os.path.join(cache_dir(), "state-%s.json" % hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
 
 
 ##
-# @brief authentification
-#  - essaie avec les données mémorisées (.cookie / .contextID)
-#  - envoie la requête d'authentification
+# @brief verrou exclusif entre processus sur un fichier (fichier .lock à côté)
 #
-# @return True/False
-def auth(new_session=False):
-    global session, sah_headers
+# @param path
+#
+# @return
+@contextlib.contextmanager
+def verrou(path):
+    with open(path + ".lock", "a") as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
 
-    debug(3, 'state file', state_file())
 
-    for i in range(2):
+##
+# @brief écrit un fichier de manière atomique (fichier temporaire puis renommage)
+#
+# @param path
+# @param data
+#
+# @return
+def ecrit_atomique(path, data):
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+    except:
+        os.unlink(tmp)
+        raise
 
-        if not new_session and os.path.exists(state_file()):
-            debug(1, 'loading saved cookies')
 
-            with open(state_file(), 'rb') as f:
-                cookies = requests.utils.cookiejar_from_dict(pickle.load(f))
+##
+# @brief écrit un fichier de manière atomique, seulement si son contenu change
+#
+# @param path
+# @param data
+#
+# @return True si le fichier a été écrit
+def ecrit_si_change(path, data):
+    try:
+        with open(path, "rb") as f:
+            if hashlib.sha1(f.read()).digest() == hashlib.sha1(data).digest():
+                return False
+    except OSError:
+        pass
+    ecrit_atomique(path, data)
+    return True
 
-                session = requests.Session()
-                session.cookies = cookies
 
-                contextID = pickle.load(f)
+##
+# @brief lit le contexte mémorisé pour la Livebox courante
+#
+# @param stale contextID refusé par la Livebox, à ignorer
+#
+# @return dict (cookies, contextID, ...) ou None s'il est absent, expiré ou refusé
+def load_state(stale=None):
+    try:
+        with open(state_file(), "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
 
-        else:
-            debug(1, "new session")
-            session = requests.Session()
-
-            debug(2, "auth for", VERSION_LIVEBOX)
-            if VERSION_LIVEBOX != 'lb4':
-                auth = { 'username':USER_LIVEBOX, 'password':PASSWORD_LIVEBOX }
-                debug(2, "auth with", str(auth))
-                r = session.post(URL_LIVEBOX + 'authenticate', params=auth)
-                debug(2, "auth return", r.text)
-            else:
-                # la mise à jour 2.19.2 de janvier 2017 a introduit un nouveau mécanisme d'authentification
-                # de plus, la donnée n'est certainement pas parsée en tant que JSON mais comme chaine de caractères
-                # car si le formalisme change un peu l'authentification échoue
-                auth = '{"service":"sah.Device.Information","method":"createContext","parameters":{"applicationName":"so_sdkut","username":"%s","password":"%s"}}' % (USER_LIVEBOX, PASSWORD_LIVEBOX)
-                sah_headers = { 'Content-Type':'application/x-sah-ws-1-call+json', 'Authorization':'X-Sah-Login' }
-                debug(2, "auth with", str(auth))
-                r = session.post(URL_LIVEBOX + 'ws', data=auth, headers=sah_headers)
-                debug(2, "auth return", r.text)
-
-            if not 'contextID' in r.json()['data']:
-                error("auth error", str(r.text))
-                break
+    if state.get('expires', 0) < time.time():
+        debug(1, "contexte mémorisé expiré")
+        return None
+    if state.get('contextID') is None or state['contextID'] == stale:
+        return None
+    return state
 
-            contextID = r.json()['data']['contextID']
 
-            # sauve le cookie et le contextID
-            debug(1, 'setting cookies')
-            with open(state_file(), 'wb') as f:
-                data = requests.utils.dict_from_cookiejar(session.cookies)
-                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
-                data = contextID
-                pickle.dump(data, f, pickle.HIGHEST_PROTOCOL)
+##
+# @brief mémorise le contexte pour la Livebox courante
+#
+# @param state
+#
+# @return
+def save_state(state):
+    ecrit_atomique(state_file(), json.dumps(state, indent=4).encode("utf-8"))
+
+
+##
+# @brief requests n'est pas dans la distrib standard de Python3, d'où le traitement spécifique
+#        pour l'import de cette librairie
+#        elle n'est chargée qu'à la première requête: son import coûte plus que le reste du démarrage
+#
+# @return le module requests
+def load_requests():
+    global requests, connexion
+    if connexion is None:
+        try:
+            import requests
+        except ImportError as e:
+            error("erreur:", e)
+            error("Installez http://www.python-requests.org/ :")
+            print("   pip3 install requests")
+            print("ou bien (selon la version de tar) :")
+            print("   curl -sL https://api.github.com/repos/kennethreitz/requests/tarball/master | tar -xzf - --strip-components 1 '*/requests'")
+            print("   curl -sL https://api.github.com/repos/kennethreitz/requests/tarball/master | tar -xzf - --strip-components=1 --wildcards '*/requests'")
+            sys.exit(2)
+        try:
+            from . import connexion
+        except ImportError:
+            import connexion
+    return requests
+
+
+##
+# @brief crée une session requests, dimensionnée pour les requêtes simultanées
+#
+# @return
+def create_session():
+    load_requests()
+    s = requests.Session()
+    # --jobs requêtes parallèles, plus les requêtes directes des étapes d'un -dump
+    adapter = connexion.AdaptateurMesure(pool_maxsize=max(10, jobs + DUMP_ETAPES))
+    s.mount('http://', adapter)
+    s.mount('https://', adapter)
+    return s
+
+
+##
+# @brief retourne la session de la commande, créée à la première requête envoyée
+#        (les réponses servies par les caches n'ont pas besoin de requests)
+#
+# @return
+def get_session():
+    global session
+    with session_lock:
+        if session is None:
+            session = create_session()
+            if session_cookies is not None:
+                session.cookies = requests.utils.cookiejar_from_dict(session_cookies)
+        return session
+
+
+##
+# @brief demande un nouveau contexte à la Livebox
+#
+# @return dict (cookies, contextID, ...) ou None
+def create_context():
+    debug(1, "new session")
+    s = create_session()
+
+    debug(2, "auth for", VERSION_LIVEBOX)
+    if VERSION_LIVEBOX != 'lb4':
+        auth = { 'username':USER_LIVEBOX, 'password':PASSWORD_LIVEBOX }
+        debug(2, "auth with", str(auth))
+        r = s.post(URL_LIVEBOX + 'authenticate', params=auth)
+        debug(2, "auth return", r.text)
+    else:
+        # la mise à jour 2.19.2 de janvier 2017 a introduit un nouveau mécanisme d'authentification
+        # de plus, la donnée n'est certainement pas parsée en tant que JSON mais comme chaine de caractères
+        # car si le formalisme change un peu l'authentification échoue
+        auth = '{"service":"sah.Device.Information","method":"createContext","parameters":{"applicationName":"so_sdkut","username":"%s","password":"%s"}}' % (USER_LIVEBOX, PASSWORD_LIVEBOX)
+        headers = { 'Content-Type':'application/x-sah-ws-1-call+json', 'Authorization':'X-Sah-Login' }
+        debug(2, "auth with", str(auth))
+        r = s.post(URL_LIVEBOX + 'ws', data=auth, headers=headers)
+        debug(2, "auth return", r.text)
+
+    if not 'contextID' in r.json()['data']:
+        error("auth error", str(r.text))
+        return None
+
+    now = time.time()
+    return { 'url': URL_LIVEBOX,
+             'user': USER_LIVEBOX,
+             'model': VERSION_LIVEBOX,
+             'cookies': requests.utils.dict_from_cookiejar(s.cookies),
+             'contextID': r.json()['data']['contextID'],
+             'created': now,
+             'expires': now + STATE_TTL }
+
+
+##
+# @brief authentification
+#  - essaie avec les données mémorisées (cookies / contextID) de la Livebox
+#  - sinon envoie la requête d'authentification, sous verrou pour que les processus
+#    simultanés partagent le même contexte
+#
+# @param new_session ignore le contexte mémorisé
+# @param stale contextID refusé par la Livebox
+#
+# @return True/False
+def auth(new_session=False, stale=None, differe=False):
+    global session, session_cookies, sah_headers, session_key, context_generation, contexte_confirme, etat_differe
+
+    debug(3, 'state file', state_file())
+
+    for i in range(2):
+
+        cree = False
+        state = None if new_session else load_state(stale)
+        if state is None:
+            with verrou(state_file()):
+                # un autre processus a peut-être renouvelé le contexte pendant l'attente du verrou
+                state = None if new_session else load_state(stale)
+                if state is None:
+                    with tracing.mesure("createContext", "auth"):
+                        state = create_context()
+                    if state is None:
+                        break
+                    cree = True
+                    if differe:
+                        # sauvé quand la requête rejouée sera acceptée (cf. contexte_accepte())
+                        etat_differe = state
+                    else:
+                        # sauve le cookie et le contextID
+                        debug(1, 'setting cookies')
+                        save_state(state)
+        else:
+            debug(1, 'loading saved cookies')
+
+        with session_lock:
+            session = None
+            session_cookies = state['cookies']
+        contextID = state['contextID']
 
         sah_headers = { 'X-Context':contextID,
                     'X-Prototype-Version':'1.7',
                     'Content-Type':'application/x-sah-ws-1-call+json; charset=UTF-8',
                     'Accept':'text/javascript' }
+        context_generation += 1
+        contexte_confirme = context_generation if cree else None
 
-        # vérification de l'authentification
-        r = session.post(URL_LIVEBOX + 'sysbus/Time:getTime', headers=sah_headers, data='{"parameters":{}}')
+        # vérification de l'authentification: par défaut, c'est la première requête refusée
+        # qui provoquera la création d'un nouveau contexte (cf. requete())
+        if not check_auth:
+            session_key = (URL_LIVEBOX, USER_LIVEBOX, VERSION_LIVEBOX)
+            return True
+
+        r = get_session().post(URL_LIVEBOX + 'sysbus/Time:getTime', headers=sah_headers, data='{"parameters":{}}')
         if r.json()['result']['status'] == True:
+            session_key = (URL_LIVEBOX, USER_LIVEBOX, VERSION_LIVEBOX)
+            contexte_confirme = context_generation
             return True
         else:
-            os.remove(state_file())
+            new_session = False
+            stale = contextID
 
     error("authentification impossible")
     return False
 
 
+##
+# @brief renouvelle le contexte après un refus, une seule fois pour des requêtes simultanées
+#
+# @param generation numéro du contexte avec lequel la requête a été refusée
+# @param differe si vrai, le nouveau contexte n'est mémorisé que si la requête rejouée est acceptée
+#
+# @return True si un contexte valide est disponible
+def reauth(generation, differe=False):
+    with auth_lock:
+        if generation != context_generation:
+            # un autre thread a déjà renouvelé le contexte
+            return True
+        debug(1, "contexte refusé, nouvelle authentification")
+        return auth(stale=sah_headers.get('X-Context'), differe=differe)
+
+
+##
+# @brief note qu'une requête a été acceptée avec un contexte, et mémorise celui-ci s'il a été
+#        créé après une erreur 13
+#
+# @param generation numéro du contexte de la requête
+#
+# @return
+def contexte_accepte(generation):
+    global contexte_confirme, etat_differe
+    if contexte_confirme == generation and etat_differe is None:
+        return
+    with auth_lock:
+        if generation != context_generation:
+            return
+        contexte_confirme = generation
+        if etat_differe is not None:
+            debug(1, 'setting cookies')
+            with verrou(state_file()):
+                save_state(etat_differe)
+            etat_differe = None
+
+
+##
+# @brief oublie le contexte créé après une erreur 13 quand la requête rejouée est refusée de la
+#        même façon: c'était un vrai refus, le contexte mémorisé reste celui des autres processus
+#
+# @param generation numéro du contexte de la requête
+#
+# @return
+def contexte_refuse(generation):
+    global etat_differe
+    with auth_lock:
+        if generation == context_generation:
+            etat_differe = None
+
+
+##
+# @brief indique si la réponse signale un contexte invalide ou expiré
+#
+# @param r réponse requests
+# @param debut premier bloc du contenu de la réponse
+#
+# @return
+def erreur_contexte(r, debut):
+    if r.status_code in (401, 403):
+        return True
+
+    # {"result":{"status":null,"errors":[{"error":13,"description":"Permission denied","info":"..."}]}}
+    # les noeuds du datamodel peuvent contenir des erreurs 13 légitimes mais pas d'objet 'result'
+    if len(debut) > 4096 or re.search(rb'"error"\s*:\s*13\b', debut) is None:
+        return False
+    try:
+        result = json.loads(debut.decode('utf-8', errors='replace'))['result']
+        return any(e.get('error') == 13 for e in result['errors'])
+    except (ValueError, KeyError, TypeError, AttributeError):
+        return False
+
+
 ##
 # @brief requêtes sans authentification: crée la session et des headers par défaut
 #
 # @return
 def noauth():
-    global session, sah_headers
-    session = requests.Session()
+    global session, session_cookies, sah_headers, session_key
+    with session_lock:
+        session = None
+        session_cookies = None
+    session_key = None
     sah_headers = { 'X-Prototype-Version':'1.7',
                     'Content-Type':'application/x-sah-ws-1-call+json; charset=UTF-8',
                     'Accept':'text/javascript' }
@@ -342,16 +665,12 @@ def noauth():
 
 
 ##
-# @brief envoie une requête sysbus à la Livebox
+# @brief nettoie le chemin d'une requête sysbus
 #
 # @param chemin
-# @param args
-# @param get
 #
-# @return
-def requete(chemin, args=None, get=False, raw=False, silent=False):
-
-    # nettoie le chemin de la requête
+# @return chemin relatif à l'url de la Livebox, préfixé par sysbus/
+def chemin_requete(chemin):
     c = str.replace(chemin or "sysbus", ".", "/")
     if c[0] == "/":
         c = c[1:]
@@ -359,68 +678,167 @@ def requete(chemin, args=None, get=False, raw=False, silent=False):
     if c[0:7] != "sysbus/":
         c = "sysbus/" + c
 
+    return c
+
+
+##
+# @brief prépare une requête sysbus
+#
+# @param chemin
+# @param args paramètres de la méthode, ou profondeur pour un GET
+# @param get
+#
+# @return (chemin relatif, données à poster ou None pour un GET)
+def prepare_requete(chemin, args=None, get=False):
+
+    # nettoie le chemin de la requête
+    c = chemin_requete(chemin)
+
     if get:
         if args is None:
             c += "?_restDepth=-1"
         else:
             c += "?_restDepth="  + str(args)
+        return c, None
 
-        debug(1, "requête: %s" % (c))
-        ts = datetime.datetime.now()
-        t = session.get(URL_LIVEBOX + c, headers=sah_headers)
-        debug(2, "durée requête: %s" % (datetime.datetime.now() - ts))
-        t = t.content
-        #t = b'[' + t.replace(b'}{', b'},{')+b']'
+    # complète les paramètres de la requête
+    parameters = { }
+    if not args is None:
+        for i in args:
+            parameters[i] = args[i]
 
-    else:
-        # complète les paramètres de la requête
-        parameters = { }
-        if not args is None:
-            for i in args:
-                parameters[i] = args[i]
-
-        data = { }
-        data['parameters'] = parameters
-
-        # l'ihm des livebox 4 utilise une autre API, qui fonctionne aussi sur les lb2 et lb3
-        sep = c.rfind(':')
-        data['service'] = c[0:sep].replace('/', '.')
-        if data['service'][0:7] == "sysbus.":
-            data['service'] = data['service'][7:]
-        data['method'] = c[sep+1:]
-        c = 'ws'
-
-        # envoie la requête avec les entêtes qui vont bien
-        debug(1, "requête: %s with %s" % (c, str(data)))
-        ts = datetime.datetime.now()
-        t = session.post(URL_LIVEBOX + c, headers=sah_headers, data=json.dumps(data))
-        debug(2, "durée requête: %s" % (datetime.datetime.now() - ts))
-        t = t.content
-
-    # il y a un truc bien moisi dans le nom netbios de la Time Capsule
-    # probable reliquat d'un bug dans le firmware de la TC ou de la Livebox
-    t = t.replace(b'\xf0\x44\x6e\x22', b'aaaa')
+    data = { }
+    data['parameters'] = parameters
+
+    # l'ihm des livebox 4 utilise une autre API, qui fonctionne aussi sur les lb2 et lb3
+    sep = c.rfind(':')
+    data['service'] = c[0:sep].replace('/', '.')
+    if data['service'][0:7] == "sysbus.":
+        data['service'] = data['service'][7:]
+    data['method'] = c[sep+1:]
+
+    return 'ws', data
+
+
+##
+# @brief indique si la méthode d'une requête sysbus est une simple lecture
+#        (même règle que misc/getws.sh)
+#
+# @param chemin
+#
+# @return
+def methode_lecture(chemin):
+    methode = chemin[chemin.rfind(':') + 1:] if ':' in chemin else ""
+    return re.match(r'(get|list|has|retrieve|logEvents)', methode) is not None
+
+
+##
+# @brief taille des blocs lus dans les réponses de la Livebox
+CHUNK_SIZE = 65536
+
+
+##
+# @brief corrige au fil de l'eau les octets invalides dans un flux de blocs, y compris
+#        quand la séquence est à cheval sur deux blocs
+#
+# il y a un truc bien moisi dans le nom netbios de la Time Capsule
+# probable reliquat d'un bug dans le firmware de la TC ou de la Livebox
+#
+# @param blocs itérable de bytes
+#
+# @return générateur de bytes
+def filtre_octets(blocs):
+    motif, remplacement = b'\xf0\x44\x6e\x22', b'aaaa'
+    garde = len(motif) - 1
+    reste = b''
+    for bloc in blocs:
+        t = (reste + bloc).replace(motif, remplacement)
+        # les derniers octets peuvent être le début du motif
+        reste = t[-garde:]
+        if len(t) > garde:
+            yield t[:-garde]
+    if reste:
+        yield reste
+
+
+##
+# @brief décode au fil de l'eau des documents JSON concaténés ('{...}{...}'),
+#        tels que les retournent les GET du datamodel
+#
+# @param blocs itérable de bytes
+#
+# @return générateur des documents décodés
+# @exception ValueError si le JSON est invalide
+def iter_json(blocs):
+    decoder = json.JSONDecoder()
+    utf8 = codecs.getincrementaldecoder('utf-8')(errors='replace')
+    espaces = re.compile(r'[\s,]*')
+    buf = ""
+    seuil = 0
+    fin = False
+    blocs = iter(blocs)
+
+    while not fin:
+        bloc = next(blocs, None)
+        if bloc is None:
+            fin = True
+            buf += utf8.decode(b'', final=True)
+        else:
+            buf += utf8.decode(bloc)
+            # document incomplet: on attend que le tampon ait doublé avant de réessayer
+            if len(buf) < seuil:
+                continue
+
+        pos = 0
+        while True:
+            pos = espaces.match(buf, pos).end()
+            if pos == len(buf):
+                break
+            try:
+                doc, pos = decoder.raw_decode(buf, pos)
+            except json.JSONDecodeError:
+                if fin:
+                    raise
+                break
+            yield doc
+
+        buf = buf[pos:]
+        seuil = 2 * len(buf)
+
+
+##
+# @brief décode la réponse d'une requête sysbus
+#
+# @param t contenu brut de la réponse
+# @param get
+# @param raw
+# @param silent
+#
+# @return
+def decode_reponse(t, get=False, raw=False, silent=False):
+
+    t = b''.join(filtre_octets([t]))
 
     if raw == True:
         return t
 
-    t = t.decode('utf-8', errors='replace')
-    if get and t.find("}{"):
-        debug(2, "listes json multiples")
-        t = "[" + t.replace("}{", "},{") + "]"
-
     try:
-        r = json.loads(t)
+        if get:
+            r = list(iter_json([t]))
+        else:
+            r = json.loads(t.decode('utf-8', errors='replace'))
     except:
         if not silent:
             error("erreur:", sys.exc_info()[0])
-            error("mauvais json:", t)
+            error("mauvais json:", t.decode('utf-8', errors='replace'))
         return
 
-    apercu = str(r)
-    if len(apercu) > 50:
-        apercu = apercu[:50] + "..."
-    debug(1, "réponse:", apercu)
+    if verbosity >= 1:
+        # la conversion de toute la réponse en chaîne est coûteuse
+        apercu = str(r)
+        if len(apercu) > 50:
+            apercu = apercu[:50] + "..."
+        debug(1, "réponse:", apercu)
 
     if not get and 'result' in r:
         if not 'errors' in r['result']:
@@ -428,7 +846,7 @@ def requete(chemin, args=None, get=False, raw=False, silent=False):
             return r['result']
         else:
             if not silent:
-                error("erreur:", t)
+                error("erreur:", t.decode('utf-8', errors='replace'))
             return None
 
     else:
@@ -436,6 +854,482 @@ def requete(chemin, args=None, get=False, raw=False, silent=False):
         return r
 
 
+##
+# @brief nombre de réponses reçues de la Livebox (progression de -dump)
+reponses = 0
+reponses_lock = threading.Lock()
+
+
+##
+# @brief envoie une requête préparée à la Livebox
+#        si le contexte est refusé, se réauthentifie et rejoue la requête, une seule fois
+#
+# @param c chemin relatif
+# @param data données à poster, None pour un GET
+# @param stream ne charge pas le contenu de la réponse
+#
+# @return (réponse requests, itérateur sur les blocs du contenu)
+def envoie_requete(c, data, stream=False):
+    global reponses
+    m = tracing.courante()
+    corps = None if data is None else json.dumps(data)
+    if corps is not None:
+        m.info('bytes_out', len(corps))
+
+    for essai in range(2):
+        generation = context_generation
+
+        # la réponse est toujours lue en flux pour mesurer séparément l'attente et le téléchargement
+        ts = time.perf_counter()
+        if data is None:
+            debug(1, "requête: %s" % (c))
+            with m.phase('ttfb'):
+                r = get_session().get(URL_LIVEBOX + c, headers=sah_headers, stream=True)
+
+        else:
+            # envoie la requête avec les entêtes qui vont bien
+            debug(1, "requête: %s with %s" % (c, str(data)))
+            with m.phase('ttfb'):
+                r = get_session().post(URL_LIVEBOX + c, headers=sah_headers, data=corps, stream=True)
+        m.info('status', r.status_code)
+
+        if not stream:
+            with m.phase('download'):
+                m.compte('bytes_in', len(r.content))
+        debug(2, "durée requête: %.3f s" % (time.perf_counter() - ts))
+
+        contenu = r.iter_content(CHUNK_SIZE)
+        if stream:
+            contenu = m.chrono('download', contenu, 'bytes_in')
+        debut = next(contenu, b'')
+        contenu = itertools.chain([debut], contenu)
+
+        # contexte expiré: on se réauthentifie et on rejoue la requête
+        # l'erreur 13 (et pas 401/403) n'est prise pour une expiration que si le contexte mémorisé
+        # n'a pas encore été accepté: sinon c'est un vrai refus, qui n'est pas rejoué
+        refus = session_key is not None and erreur_contexte(r, debut)
+        if refus and essai == 0:
+            http = r.status_code in (401, 403)
+            if http or contexte_confirme != generation:
+                r.close()
+                m.compte('retries')
+                if reauth(generation, differe=not http):
+                    continue
+        break
+
+    if session_key is not None:
+        if not refus:
+            contexte_accepte(generation)
+        elif essai == 1:
+            contexte_refuse(generation)
+
+    with reponses_lock:
+        reponses += 1
+    return r, contenu
+
+
+##
+# @brief durée de validité (secondes) des réponses en cache, par "service:méthode", par service
+#        ou par méthode: seules les méthodes de cette liste sont mises en cache
+CACHE_TTL = {
+    "DeviceInfo:get": 300,
+    "Hosts.Host:get": 30,
+    "Devices:get": 30,
+    "getMIBs": 30,
+    "getIntfs": 300,
+}
+
+##
+# @brief MIBs sans secret: getMIBs n'est mise en cache que si elle demande explicitement ces MIBs
+#        (wlanvap contient les clés Wi-Fi, ppp les identifiants de connexion); -wifi, -MIBs show
+#        et les lectures de toutes les MIBs (-MIBs table/dump) sont donc exclues volontairement,
+#        une projection sans secret ne pourrait pas leur servir de réponse
+CACHE_MIBS = { "alias", "base", "bridge", "dsl", "eth", "llintfs", "netdev", "switch", "ulintfs", "vlan", "wlanradio" }
+
+##
+# @brief taille maximale du cache des réponses (octets), les moins récemment utilisées sont supprimées
+CACHE_MAX_SIZE = 32 * 1048576
+
+##
+# @brief cache des réponses: --no-cache pour le désactiver, --max-age pour imposer une durée de validité
+cache_enabled = True
+cache_max_age = None
+cache_db = None
+cache_lock = threading.Lock()
+sqlite3 = None
+
+
+##
+# @brief ouvre la base du cache des réponses
+#
+# @return connexion sqlite, ou None si le cache est désactivé ou inutilisable
+def cache_ouvre():
+    global cache_db, cache_enabled, sqlite3
+    if cache_db is None and cache_enabled:
+        import sqlite3
+        try:
+            # la base n'est lisible que par l'utilisateur (sqlite donne les mêmes droits au journal WAL)
+            nom = os.path.join(cache_dir(), "responses.sqlite")
+            os.close(os.open(nom, os.O_WRONLY | os.O_CREAT, 0o600))
+            os.chmod(nom, 0o600)
+            cache_db = sqlite3.connect(nom, timeout=5, check_same_thread=False)
+            cache_db.execute("PRAGMA journal_mode=WAL")
+            cache_db.execute("CREATE TABLE IF NOT EXISTS reponses (cle TEXT PRIMARY KEY, livebox TEXT, objet TEXT, "
+                             "date REAL, acces REAL, taille INTEGER, contenu BLOB)")
+            # les versions précédentes mettaient en cache toutes les lectures, secrets compris
+            if cache_db.execute("PRAGMA user_version").fetchone()[0] < 1:
+                cache_db.execute("DELETE FROM reponses")
+                cache_db.execute("PRAGMA user_version=1")
+                cache_db.commit()
+        except (sqlite3.Error, OSError) as e:
+            debug(1, "cache désactivé: %s" % e)
+            cache_db = None
+            cache_enabled = False
+    return cache_db
+
+
+##
+# @brief retourne la durée de validité en cache d'une méthode
+#
+# @param service
+# @param methode
+# @param parameters paramètres de la requête
+#
+# @return secondes, 0 si la réponse ne doit pas être mise en cache
+def cache_ttl(service, methode, parameters=None):
+    if methode == "getMIBs":
+        mibs = str((parameters or {}).get("mibs", "")).replace(",", " ").split()
+        if not mibs or not CACHE_MIBS.issuperset(mibs):
+            return 0
+    for k in ("%s:%s" % (service, methode), service, methode):
+        if k in CACHE_TTL:
+            return CACHE_TTL[k]
+    return 0
+
+
+##
+# @brief retourne l'identifiant de la Livebox pour le cache (les droits dépendent de l'utilisateur)
+#
+# @return
+def cache_livebox():
+    return "%s|%s" % (URL_LIVEBOX, USER_LIVEBOX if session_key else "")
+
+
+##
+# @brief retourne la clé de cache d'une requête ws, ou None si elle n'est pas cacheable
+#
+# @param data requête préparée par prepare_requete()
+#
+# @return
+def cache_cle(data):
+    if not cache_enabled or not methode_lecture("%s:%s" % (data['service'], data['method'])):
+        return None
+    if cache_ttl(data['service'], data['method'], data['parameters']) <= 0:
+        return None
+    cle = [ cache_livebox(), data['service'], data['method'], data['parameters'] ]
+    return hashlib.sha1(json.dumps(cle, sort_keys=True).encode("utf-8")).hexdigest()
+
+
+##
+# @brief lit une réponse en cache encore valide
+#
+# @param data requête préparée
+#
+# @return contenu de la réponse, ou None
+def cache_lit(data):
+    cle = cache_cle(data)
+    if cle is None or cache_max_age == 0:
+        return None
+    ttl = cache_ttl(data['service'], data['method'], data['parameters']) if cache_max_age is None else cache_max_age
+    with cache_lock:
+        db = cache_ouvre()
+        if db is None:
+            return None
+        try:
+            row = db.execute("SELECT date, contenu FROM reponses WHERE cle=?", (cle,)).fetchone()
+            if row is None or time.time() - row[0] >= ttl:
+                return None
+            db.execute("UPDATE reponses SET acces=? WHERE cle=?", (time.time(), cle))
+            db.commit()
+        except sqlite3.Error as e:
+            debug(1, "cache: %s" % e)
+            return None
+    debug(1, "réponse en cache: %s:%s" % (data['service'], data['method']))
+    return row[1]
+
+
+##
+# @brief met en cache la réponse d'une méthode de lecture, ou invalide les réponses de l'objet
+#        après une méthode de modification, ainsi que celles de NeMo qui reflète toutes les interfaces
+#
+# @param data requête préparée
+# @param t contenu de la réponse (None si la requête a échoué)
+#
+# @return
+def cache_ecrit(data, t):
+    if not cache_enabled:
+        return
+
+    objet = data['service'].split('.')[0]
+    if not methode_lecture("%s:%s" % (data['service'], data['method'])):
+        requete_sql = ("DELETE FROM reponses WHERE livebox=? AND objet IN (?, 'NeMo')", (cache_livebox(), objet))
+    else:
+        cle = cache_cle(data)
+        # les réponses en erreur ne sont pas conservées
+        if cle is None or t is None or b'"errors"' in t:
+            return
+        now = time.time()
+        requete_sql = ("INSERT OR REPLACE INTO reponses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                       (cle, cache_livebox(), objet, now, now, len(t), t))
+
+    with cache_lock:
+        db = cache_ouvre()
+        if db is None:
+            return
+        try:
+            db.execute(*requete_sql)
+            # éviction des réponses les moins récemment utilisées
+            taille = db.execute("SELECT COALESCE(SUM(taille), 0) FROM reponses").fetchone()[0]
+            if taille > CACHE_MAX_SIZE:
+                for cle, n in db.execute("SELECT cle, taille FROM reponses ORDER BY acces").fetchall():
+                    db.execute("DELETE FROM reponses WHERE cle=?", (cle,))
+                    taille -= n
+                    if taille <= CACHE_MAX_SIZE:
+                        break
+            db.commit()
+        except sqlite3.Error as e:
+            debug(1, "cache: %s" % e)
+
+
+##
+# @brief lectures en cours ou déjà faites pendant la commande: les lectures identiques partagent
+#        la même requête et sa réponse, une méthode de modification vide la table
+memo = {}
+memo_lock = threading.Lock()
+
+
+##
+# @brief vide la table des lectures partagées
+#
+# @return
+def memo_vide():
+    with memo_lock:
+        memo.clear()
+
+
+##
+# @brief exécute une requête ws en partageant les lectures identiques (single-flight)
+#
+# @param data requête préparée
+# @param charge fonction qui retourne le contenu de la réponse
+#
+# @return contenu de la réponse
+def requete_partagee(data, charge):
+    if not methode_lecture("%s:%s" % (data['service'], data['method'])):
+        # barrière: les lectures faites avant ou pendant la modification ne sont plus valables
+        memo_vide()
+        try:
+            return charge()
+        finally:
+            memo_vide()
+
+    cle = json.dumps([ cache_livebox(), data['service'], data['method'], data['parameters'] ], sort_keys=True)
+    with memo_lock:
+        f = memo.get(cle)
+        proprietaire = f is None
+        if proprietaire:
+            f = memo[cle] = concurrent.futures.Future()
+
+    if proprietaire:
+        try:
+            f.set_result(charge())
+        except BaseException as e:
+            f.set_exception(e)
+            with memo_lock:
+                if memo.get(cle) is f:
+                    del memo[cle]
+    else:
+        debug(1, "réponse partagée: %s:%s" % (data['service'], data['method']))
+        tracing.courante().info('cache', 'memo')
+
+    return f.result()
+
+
+##
+# @brief envoie une requête ws préparée, en passant par le cache des réponses
+#
+# @param c chemin relatif
+# @param data requête préparée
+#
+# @return contenu de la réponse
+def charge_ws(c, data):
+    t = cache_lit(data)
+    if t is None:
+        r, _ = envoie_requete(c, data)
+        t = r.content
+        cache_ecrit(data, t if r.status_code == 200 else None)
+    else:
+        tracing.courante().info('cache', 'disk')
+    return t
+
+
+##
+# @brief envoie une requête sysbus à la Livebox
+#
+# @param chemin
+# @param args
+# @param get
+#
+# @return
+def requete(chemin, args=None, get=False, raw=False, silent=False):
+
+    if get and not raw:
+        try:
+            r = list(requete_nodes(chemin, args))
+        except ValueError as e:
+            if not silent:
+                error("erreur:", type(e))
+                error("mauvais json:", getattr(e, 'doc', str(e)))
+            return
+
+        if verbosity >= 1:
+            apercu = str(r)
+            if len(apercu) > 50:
+                apercu = apercu[:50] + "..."
+            debug(1, "réponse:", apercu)
+        debug(1, "-------------------------")
+        return r
+
+    c, data = prepare_requete(chemin, args, get)
+
+    with tracing.mesure(c if data is None else "%s:%s" % (data['service'], data['method']), "ws") as m:
+        if data is None:
+            r, _ = envoie_requete(c, data)
+            t = r.content
+        else:
+            t = requete_partagee(data, functools.partial(charge_ws, c, data))
+
+        with m.phase('decode'):
+            return decode_reponse(t, get, raw, silent)
+
+
+##
+# @brief interroge le datamodel et retourne les noeuds au fur et à mesure de leur réception,
+#        sans charger la réponse entière en mémoire
+#
+# @param chemin
+# @param prof profondeur (-1 par défaut: tout le sous-arbre)
+#
+# @return générateur des noeuds
+# @exception ValueError si le JSON est invalide
+def requete_nodes(chemin, prof=None):
+    c, _ = prepare_requete(chemin, prof, get=True)
+
+    # mesure propre: le générateur peut être suspendu pendant que le thread fait autre chose
+    m = tracing.nouvelle(c, "get")
+    try:
+        with tracing.active(m):
+            r, contenu = envoie_requete(c, None, stream=True)
+        try:
+            yield from m.chrono('decode', iter_json(filtre_octets(contenu)))
+        finally:
+            r.close()
+    finally:
+        tracing.termine(m)
+
+
+##
+# @brief places des requêtes parallèles, communes à tout le processus: même lancées par plusieurs
+#        requetes() à la fois (étapes d'un -dump), au plus --jobs requêtes sont en cours
+#        (jobs, sémaphore)
+places = None
+places_lock = threading.Lock()
+
+
+##
+# @brief exécute requete() en occupant une des places des requêtes parallèles
+#
+# @param args arguments de requete()
+#
+# @return
+def requete_place(*args):
+    global places
+    with places_lock:
+        # le démon peut changer --jobs d'une commande à l'autre
+        if places is None or places[0] != jobs:
+            places = (jobs, threading.Semaphore(max(1, jobs)))
+        semaphore = places[1]
+    with semaphore:
+        return requete(*args)
+
+
+##
+# @brief version asyncio de requete(): la requête est exécutée dans un thread de l'executor
+#        de la boucle, la session requests étant partagée (même chemin, mêmes entêtes), quand
+#        une place des requêtes parallèles est libre
+#
+# @param chemin
+# @param args
+# @param get
+# @param raw
+# @param silent
+# @param executor executor à utiliser (celui par défaut de la boucle si None)
+#
+# @return
+async def requete_async(chemin, args=None, get=False, raw=False, silent=False, executor=None):
+    import asyncio
+    loop = asyncio.get_event_loop()
+    return await loop.run_in_executor(executor, functools.partial(requete_place, chemin, args, get, raw, silent))
+
+
+##
+# @brief exécute plusieurs requêtes sysbus en parallèle, au plus concurrency à la fois
+#
+# @param appels liste de requêtes: chemin, tuple (chemin, args) ou dict des arguments de requete()
+# @param concurrency nombre maximal de requêtes simultanées (--jobs par défaut)
+# @param exceptions si vrai, l'exception d'une requête est renvoyée à la place de son résultat
+#                   au lieu d'interrompre les autres
+# @param kwargs arguments communs à toutes les requêtes (get, raw, silent)
+#
+# @return liste des résultats, dans l'ordre des appels
+async def requetes_async(appels, concurrency=None, exceptions=False, **kwargs):
+    import asyncio
+    concurrency = max(1, concurrency or jobs)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=concurrency) as executor:
+
+        async def appel(a):
+            if isinstance(a, dict):
+                a = dict(kwargs, **a)
+            elif isinstance(a, (tuple, list)):
+                a = dict(kwargs, **dict(zip(("chemin", "args"), a)))
+            else:
+                a = dict(kwargs, chemin=a)
+            async with semaphore:
+                return await requete_async(executor=executor, **a)
+
+        return await asyncio.gather(*[appel(a) for a in appels], return_exceptions=exceptions)
+
+
+##
+# @brief exécute plusieurs requêtes sysbus en parallèle (version synchrone de requetes_async)
+#
+# @param appels
+# @param concurrency
+# @param kwargs
+#
+# @return liste des résultats, dans l'ordre des appels
+def requetes(appels, concurrency=None, **kwargs):
+    # asyncio n'est chargé que par les commandes qui font des requêtes parallèles
+    import asyncio
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(requetes_async(appels, concurrency, **kwargs))
+    finally:
+        loop.close()
+
+
 ##
 # @brief envoie une requête sysbus et affiche le résultat
 #
@@ -457,12 +1351,27 @@ def requete_print(chemin, args=None, get=False):
 ##
 # @brief affiche le modèle
 #
+#        parcours en profondeur avec une pile explicite (pas de limite de récursion), les lignes
+#        sont accumulées et écrites par blocs dans file
+#
 # @param node
 # @param level
+# @param file sortie (sys.stdout par défaut)
 #
 # @return
 def model(node, level=0, file=None):
 
+    if file is None:
+        file = sys.stdout
+
+    tampon = []
+    ecrit = tampon.append
+
+    def vide():
+        if tampon:
+            file.write("".join(tampon))
+            tampon.clear()
+
     def print_functions(node, indent=''):
         for f in node["functions"]:
             aa = ""
@@ -475,75 +1384,63 @@ def model(node, level=0, file=None):
                 if 'attributes' in a and 'out' in a['attributes'] and a['attributes']['out']:
                     flag = "out "
                 aa += ", " + flag + a['name']
-            print(indent + "function:", f['name'], "(" + aa[2:] + ")", file=file)
+            ecrit("%sfunction: %s (%s)\n" % (indent, f['name'], aa[2:]))
 
     def print_parameters(node, indent=''):
         if 'parameters' in node:
             for p in node['parameters']:
-                print(indent + "parameter:  %-20s : %-10s = '%s'" % (p['name'], p['type'], p['value']), file=file)
+                ecrit(indent + "parameter:  %-20s : %-10s = '%s'\n" % (p['name'], p['type'], p['value']))
 
 
-    # si ce n'est pas un datamodel, on sort
-    if not 'objectInfo' in node:
-        # pprint.pprint(node)
-        json.dump(node, sys.stdout, indent=4)
-        return
+    pile = [ (node, level) ]
+    while pile:
+        node, level = pile.pop()
+
+        # si ce n'est pas un datamodel, on passe au suivant
+        if not 'objectInfo' in node:
+            ecrit(json.dumps(node, indent=4))
+            continue
+
+        o = node['objectInfo']
+
+        ecrit("\n=========================================== level %d\n" % level)
+        ecrit("OBJECT NAME: '%s.%s'  (name: %s)\n" % (o['keyPath'], o['key'], o['name'] ))
+
+        print_functions(node)
+        print_parameters(node)
 
-    o = node['objectInfo']
-
-    print("", file=file)
-    print("=========================================== level", level, file=file)
-    print("OBJECT NAME: '%s.%s'  (name: %s)" % (o['keyPath'], o['key'], o['name'] ), file=file)
-
-    print_functions(node)
-    print_parameters(node)
-
-    for i in node:
-        if i == "children":
-            #print("has children...", len(node[i]), file=file)
-            pass
-        elif i == "objectInfo":
-             pass
-        elif i == "functions":
-            pass
-        elif i == "parameters":
-            pass
-
-        elif i == "--templateInfo":
-            print("templateInfo:")
-            # pprint.pprint(node[i])
-            json.dump(node[i], sys.stdout, indent=4)
-            sys.exit()
-
-        elif i == "errors":
-            for e in node["errors"]:
-                print(e["error"],  e["info"], e["description"], file=file)
-        elif i == "instances":
-            print("-->", i, len(node[i]), file=file)
-            if i == "instances" and len(node[i])>0:
+        for i in node:
+            if i in ("children", "objectInfo", "functions", "parameters"):
+                pass
+
+            elif i == "--templateInfo":
+                ecrit("templateInfo:\n")
+                ecrit(json.dumps(node[i], indent=4))
+                vide()
+                sys.exit()
+
+            elif i == "errors":
+                for e in node["errors"]:
+                    ecrit("%s %s %s\n" % (e["error"], e["info"], e["description"]))
+            elif i == "instances":
+                ecrit("--> %s %d\n" % (i, len(node[i])))
                 k = 0
                 for j in node[i]:
                     k += 1
-
-                    #assert(len(j['children']) == 0)
-                    #assert(len(j['instances']) == 0)
-                    #print(j)
-                    #model(j, 99)
-
-                    print("instance %d: '%s.%s' (name: %s)" % (k, j['objectInfo']['keyPath'], j['objectInfo']['key'], j['objectInfo']['name']), file=file)
-                    #print("j=",j)
-                    #print("oi=", j['objectInfo'])
+                    ecrit("instance %d: '%s.%s' (name: %s)\n" % (k, j['objectInfo']['keyPath'], j['objectInfo']['key'], j['objectInfo']['name']))
                     print_functions(j, indent="    ")
                     print_parameters(j, indent="    ")
-                    pass
-        else:
-            print("-->", i, len(node[i]), file=file)
+            else:
+                ecrit("--> %s %d\n" % (i, len(node[i])))
 
-    if 'children' in node:
-        for c in node['children']:
-            model(c, level + 1, file=file)
+        # les enfants sont empilés à l'envers pour être affichés dans l'ordre
+        if 'children' in node:
+            pile.extend((c, level + 1) for c in reversed(node['children']))
 
+        if len(tampon) >= 4096:
+            vide()
 
+    vide()
 
 
 ##
@@ -567,7 +1464,7 @@ def scan_sysbus(args):
             debug(1, "lecture de %s" % "scripts.js")
         else:
             # lecture scripts.js sur la Livebox
-            session = requests.Session()
+            session = load_requests().Session()
             rep = session.get(URL_LIVEBOX + "scripts.js")
             s = rep.text
             session.close()
@@ -610,7 +1507,7 @@ def extract_files(args):
             js = f.read()
             f.close()
     else:
-        session = requests.Session()
+        session = load_requests().Session()
         rep = session.get(URL_LIVEBOX + "scripts.js")
         js = rep.text
         session.close()
@@ -644,27 +1541,160 @@ def extract_files(args):
 
 
 ##
-# @brief demande le module de gestion de graphviz.
-# il y en a plusieurs, j'en ai choisi récent et qui fonctionne avec python3
+# @brief demande le module de gestion de graphviz.
+# il y en a plusieurs, j'en ai choisi récent et qui fonctionne avec python3
+#
+# documentation:
+#   http://www.graphviz.org/
+#   http://graphviz.readthedocs.org/
+#
+# @return
+def load_graphviz():
+    try:
+        from graphviz import Digraph as dg
+    except ImportError as e:
+        error("erreur:", e)
+        error("Installez https://github.com/xflr6/graphviz : pip3 install graphviz")
+        sys.exit(2)
+    return dg
+
+
+##
+# @brief demande le module d'analyse de la base OUI de Wireshark
+#
+# @return la classe MacParser, ou None si le module est absent
+def load_manuf():
+    try:
+        from .manuf import MacParser
+    except ImportError:
+        try:
+            from manuf import MacParser
+        except ImportError:
+            return None
+    return MacParser
+
+
+##
+# @brief retourne l'emplacement de l'index compilé de la base OUI, dans le cache de l'utilisateur
+#        (le répertoire du module n'est pas forcément accessible en écriture); le nom dépend
+#        du fichier manuf pour que deux installations ne reconstruisent pas le même index
+#
+# @return chemin, ou None pour l'index par défaut à côté du fichier manuf
+def oui_index():
+    key = os.path.abspath(manuf_name)
+    try:
+        return os.path.join(cache_dir(), "manuf-%s.idx" % hashlib.sha1(key.encode("utf-8")).hexdigest()[:16])
+    except OSError:
+        return None
+
+
+##
+# @brief retourne l'analyseur de la base OUI, chargé au premier appel: l'index compilé est
+#        projeté en mémoire, le fichier manuf n'est analysé que s'il a changé
+#
+# @return MacParser, ou None si le module est absent
+def get_mac_parser():
+    global mac_parser
+    if mac_parser is None:
+        MacParser = load_manuf()
+        if MacParser is not None:
+            mac_parser = MacParser(manuf_name, index_name=oui_index())
+    return mac_parser
+
+
+
+##
+# @brief récupère un sous-arbre du datamodel par morceaux en parallèle: le noeud est lu avec
+#        une profondeur de 1, puis chacun de ses enfants et instances avec tout son sous-arbre
+#        (ou récursivement par niveau jusqu'à la profondeur demandée), et l'arbre est réassemblé
 #
-# documentation:
-#   http://www.graphviz.org/
-#   http://graphviz.readthedocs.org/
+# les enfants interdits d'accès (erreur 13) ne sont pas dans children mais dans les errors
+# du noeud parent, qui sont conservées telles quelles
+#
+# @param chemin
+# @param niveaux nombre de niveaux découpés en requêtes séparées
+#
+# @return liste des noeuds, comme requete(get=True), ou None
+async def crawl_model_async(chemin, niveaux=1):
+    import asyncio
+    semaphore = asyncio.Semaphore(jobs)
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+
+        async def get(chemin, prof):
+            async with semaphore:
+                return await requete_async(chemin, prof, get=True, silent=True, executor=executor)
+
+        async def complete(node, niveau):
+            taches = []
+            for liste in ('children', 'instances'):
+                for k in range(len(node.get(liste) or [])):
+                    taches.append(sous_arbre(node[liste], k, niveau))
+            await asyncio.gather(*taches)
+
+        async def sous_arbre(liste, k, niveau):
+            o = liste[k]['objectInfo']
+            chemin = "sysbus." + (o['keyPath'] + "." if o['keyPath'] else "") + o['key']
+            r = await get(chemin, 1 if niveau < niveaux else None)
+            if not r or 'objectInfo' not in r[0]:
+                # garde le noeud tronqué
+                debug(1, "sous-arbre non accessible: %s" % chemin)
+                return
+            liste[k] = r[0]
+            if niveau < niveaux:
+                await complete(r[0], niveau + 1)
+
+        racine = await get(chemin, 1)
+        if racine is None:
+            return None
+        await asyncio.gather(*[complete(node, 1) for node in racine if 'objectInfo' in node])
+        return racine
+
+
+##
+# @brief version synchrone de crawl_model_async()
+#
+# @param chemin
+# @param niveaux
 #
 # @return
-def load_graphviz():
+def crawl_model(chemin, niveaux=1):
+    import asyncio
+    loop = asyncio.new_event_loop()
     try:
-        from graphviz import Digraph as dg
-    except ImportError as e:
-        error("erreur:", e)
-        error("Installez https://github.com/xflr6/graphviz : pip3 install graphviz")
-        sys.exit(2)
-    return dg
+        return loop.run_until_complete(crawl_model_async(chemin, niveaux))
+    finally:
+        loop.close()
+
 
+##
+# @brief vrai pendant l'exécution d'un -dump
+dump_en_cours = False
+
+
+##
+# @brief affiche la progression d'un téléchargement sur stderr (si c'est un terminal)
+#
+# @param nom
+# @param octets octets reçus
+# @param total taille annoncée, ou None
+# @param fin
+#
+# @return
+def progression(nom, octets, total=None, fin=False):
+    # pendant un -dump, seule la progression globale est affichée
+    if dump_en_cours or not sys.stderr.isatty():
+        return
+    s = "\r%s: %.1f Mo" % (nom, octets / 1048576.)
+    if total:
+        s += " / %.1f Mo (%d%%)" % (total / 1048576., octets * 100 // total)
+    sys.stderr.write(s + ("\n" if fin else ""))
+    sys.stderr.flush()
 
 
 ##
 # @brief dumpe dans un fichier le datamodel, à partir d'un noeud ou depuis la racine
+#        la réponse est écrite au fil de sa réception, compressée si le fichier se termine par .gz
 #
 # @param chemin
 # @param prof
@@ -673,15 +1703,54 @@ def load_graphviz():
 # @return
 def model_raw_cmd(chemin, prof=None, out=None):
 
-    r = requete(chemin, prof, get=True, raw=True)
+    out = out or "model.json"
+    requests = load_requests()
 
-    if not r is None:
-        with open(out or "model.json", "wb") as f:
-            f.write(r)
-            f.close()
-        debug(1, "modèle écrit dans", out or "model.json")
+    if crawl and prof is None:
+        # datamodel récupéré par sous-arbres, réécrit sous forme de documents JSON concaténés
+        nodes = crawl_model(chemin, crawl)
+        if nodes is None:
+            error("modèle non accessible")
+            return
+        r = None
+        m = tracing.NULLE
+        contenu = (json.dumps(node, separators=(',', ':'), ensure_ascii=False).encode('utf-8') for node in nodes)
+        total = None
     else:
-        error("modèle non accessible")
+        c, _ = prepare_requete(chemin, prof, get=True)
+        m = tracing.nouvelle(c, "get")
+        try:
+            with tracing.active(m):
+                r, contenu = envoie_requete(c, None, stream=True)
+        except requests.RequestException as e:
+            tracing.termine(m)
+            error("modèle non accessible:", e)
+            return
+        total = r.headers.get('Content-Length')
+        total = int(total) if total and total.isdigit() else None
+
+    octets = 0
+
+    ouvre = functools.partial(gzip.open, compresslevel=6) if out.endswith(".gz") else open
+    try:
+        with ouvre(out + ".part", "wb") as f:
+            for bloc in filtre_octets(contenu):
+                f.write(bloc)
+                octets += len(bloc)
+                progression(out, octets, total)
+        progression(out, octets, total, fin=True)
+        os.replace(out + ".part", out)
+    except (requests.RequestException, OSError) as e:
+        error("modèle non accessible:", e)
+        if os.path.exists(out + ".part"):
+            os.unlink(out + ".part")
+        return
+    finally:
+        if r is not None:
+            r.close()
+        tracing.termine(m)
+
+    debug(1, "modèle écrit dans", out, "(%d octets)" % octets)
 
 
 
@@ -824,12 +1893,18 @@ def open_file_in_os(filename):
 # @return
 def model_uml_cmd(chemin, prof=None, out=None):
 
-    model = requete(chemin, prof, get=True, raw=True)
-    if not model:
-        return
+    if crawl and prof is None:
+        model = crawl_model(chemin, crawl)
+        if not model:
+            return
+        model = model[0]
+    else:
+        model = requete(chemin, prof, get=True, raw=True)
+        if not model:
+            return
 
-    model = model.decode('utf-8', errors='replace')
-    model = json.loads(model)
+        model = model.decode('utf-8', errors='replace')
+        model = json.loads(model)
 
     plants = []
 
@@ -883,40 +1958,8 @@ def model_uml_cmd(chemin, prof=None, out=None):
 
 
 ##
-# @brief crée un tableau croisé MIBs/Interfaces
-#
-# @param output_html
-#
-# @return
-def MIBs_table_cmd(output_html=False):
-    intf = set()
-    mibs = set()
-
-    r = requete("NeMo.Intf.lo:getMIBs", { "traverse": "all" })
-    if r is None or not 'status' in r: return
-
-    r = r['status']
-
-    for m in r:
-        mibs.add(m)
-        for i in r[m]:
-            intf.add(i)
-
-    mibs = sorted(mibs)
-    intf = sorted(intf)
-
-    #print("MIBs (%d): %s" % (len(mibs), str(mibs)))
-    #print("Intf (%d): %s" % (len(intf), str(intf)))
-
-    if output_html:
-        # affichage dans une page HTML
-
-        print(
-'''<!DOCTYPE html>
-<html>
-<head>
-
-<style>
+# @brief feuille de style des tableaux croisés MIBs/Interfaces en HTML
+MIBS_STYLE = '''<style>
 table {
     width:100%;
 }
@@ -958,14 +2001,35 @@ table#t01 td:nth-child(1)	{
     z-index: 1;
     display: none;
 }
-</style>
+</style>'''
 
-<script>
+##
+# @brief script des rapports MIBs/Interfaces en répertoire: les détails d'une interface sont
+#        chargés au premier clic depuis details/<interface>.js (un <script> plutôt que fetch(),
+#        qui est interdit pour les pages ouvertes en file://)
+MIBS_SCRIPT_DIFFERE = '''<script>
 var last = null;
-function fenetre(nom) {
+var details = {};
+var attente = {};
+function fenetre(intf, mib) {
     fenetre_close();
-    document.getElementById(nom).style.display="inline-block";
-    last = nom;
+    var nom = mib ? intf + "#" + mib : intf;
+    var affiche = function() {
+        var d = document.getElementById(nom);
+        if (!d.firstChild) {
+            d.textContent = details[intf][mib || ""];
+        }
+        d.style.display = "inline-block";
+        last = nom;
+    };
+    if (intf in details) {
+        affiche();
+    } else {
+        attente[intf] = affiche;
+        var s = document.createElement("script");
+        s.src = "details/" + encodeURIComponent(intf) + ".js";
+        document.head.appendChild(s);
+    }
 }
 function fenetre_close() {
     if (last) {
@@ -973,39 +2037,56 @@ function fenetre_close() {
         last = null;
     }
 }
-</script>
-
-</head>
-<body>
+function details_charge(intf, d) {
+    details[intf] = d;
+    if (attente[intf]) {
+        attente[intf]();
+        delete attente[intf];
+    }
+}
+</script>'''
 
-''')
 
-        print('<table id="t01">')
+##
+# @brief lignes HTML du tableau croisé MIBs/Interfaces, produites au fur et à mesure que les détails
+#        des interfaces arrivent (demandés en parallèle par lots): une interface en erreur est
+#        affichée en rouge sans interrompre les autres
+#
+# @param r MIBs de toutes les interfaces (résultat de getMIBs)
+# @param mibs liste triée des MIBs
+# @param intf liste triée des interfaces
+# @param differe si vrai, les fenêtres de détails sont vides et leurs textes sont retournés à part
+#
+# @return générateur de (interface, ligne HTML, textes des fenêtres: "" pour l'interface, sinon le nom de la MIB)
+def MIBs_table_lignes(r, mibs, intf, differe=False):
+    lot = max(1, jobs) * 4
+    for debut in range(0, len(intf), lot):
+        tranche = intf[debut:debut + lot]
+        details = requetes(["NeMo.Intf.%s:get" % i for i in tranche], silent=True, exceptions=True)
 
-        # la ligne d'entête
-        print('  <tr>')
-        print('    <th>%s</th>' % 'Intf')
-        for m in mibs:
-            print('    <th>%s</th>' % m)
-        print('  </tr>')
+        for i, rr in zip(tranche, details):
+            if isinstance(rr, Exception):
+                debug(1, "NeMo.Intf.%s:get: %s" % (i, rr))
 
-        for i in intf:
-            print('  <tr>')
+            textes = {}
+            ligne = ['  <tr>']
 
             # la première colonne: le nom de l'interface
-            rr = requete("NeMo.Intf.%s:get" % i, silent=True)
             action = 'fenetre_close()'
-            if not rr or 'status' not in rr:
+            if isinstance(rr, Exception) or not rr or 'status' not in rr:
                 x = '<div style="color:red;">' + i + '</div>'
             else:
                 # cellule cliquable pour afficher les détails
-                details = html.escape(pprint.pformat(rr['status']))
-                x = '\n<div id="%s" class="details" onclick="fenetre_close()">' % (i)
-                x += details
-                x += '</div>\n'
+                if differe:
+                    textes[""] = pprint.pformat(rr['status'])
+                    x = '<div id="%s" class="details" onclick="fenetre_close()"></div>' % (i)
+                else:
+                    x = '\n<div id="%s" class="details" onclick="fenetre_close()">' % (i)
+                    x += html.escape(pprint.pformat(rr['status']))
+                    x += '</div>\n'
                 x += '<div style="color:darkblue;">' + i + '</div>'
                 action = 'fenetre(\'%s\')' % (i)
-            print('    <td onclick="%s">%s</td>' % (action, x))
+            ligne.append('    <td onclick="%s">%s</td>' % (action, x))
 
             # les autres colonnes: les MIBs
             for m in mibs:
@@ -1017,21 +2098,106 @@ function fenetre_close() {
                     else:
                         # il y a des valeurs pour la MIB
                         # cellule cliquable pour afficher les détails
-                        x = '<div id="%s#%s" class="details" onclick="fenetre_close()">' % (i, m)
-                        x += html.escape(pprint.pformat(r[m][i]))
-                        x += '</div>'
+                        if differe:
+                            textes[m] = pprint.pformat(r[m][i])
+                            x = '<div id="%s#%s" class="details" onclick="fenetre_close()"></div>' % (i, m)
+                            action = 'fenetre(\'%s\', \'%s\')' % (i, m)
+                        else:
+                            x = '<div id="%s#%s" class="details" onclick="fenetre_close()">' % (i, m)
+                            x += html.escape(pprint.pformat(r[m][i]))
+                            x += '</div>'
+                            action = 'fenetre(\'%s#%s\')' % (i, m)
                         x += '<div style="color:darkblue;">X</div>'
-                        action = 'fenetre(\'%s#%s\')' % (i, m)
                 else:
                     # MIB absente pour l'interface
                     x = ""
-                print('    <td onclick="%s">%s</td>' % (action, x))
+                ligne.append('    <td onclick="%s">%s</td>' % (action, x))
+
+            ligne.append('  </tr>')
+            yield i, "\n".join(ligne), textes
+
+
+##
+# @brief crée un tableau croisé MIBs/Interfaces
+#
+# @param output_html
+# @param rep répertoire où écrire le rapport HTML à détails différés, None pour la sortie standard
+#
+# @return
+def MIBs_table_cmd(output_html=False, rep=None):
+    intf = set()
+    mibs = set()
+
+    r = requete("NeMo.Intf.lo:getMIBs", { "traverse": "all" })
+    if r is None or not 'status' in r: return
+
+    r = r['status']
+
+    for m in r:
+        mibs.add(m)
+        for i in r[m]:
+            intf.add(i)
+
+    mibs = sorted(mibs)
+    intf = sorted(intf)
+
+    #print("MIBs (%d): %s" % (len(mibs), str(mibs)))
+    #print("Intf (%d): %s" % (len(intf), str(intf)))
+
+    if output_html and rep:
+        MIBs_table_rep(r, mibs, intf, rep)
+
+    elif output_html:
+        # affichage dans une page HTML
+
+        # la page est construite en mémoire puis écrite d'un bloc
+        page = []
+        ligne = page.append
+
+        ligne(
+'''<!DOCTYPE html>
+<html>
+<head>
+
+''' + MIBS_STYLE + '''
+
+<script>
+var last = null;
+function fenetre(nom) {
+    fenetre_close();
+    document.getElementById(nom).style.display="inline-block";
+    last = nom;
+}
+function fenetre_close() {
+    if (last) {
+        document.getElementById(last).style.display="none";
+        last = null;
+    }
+}
+</script>
+
+</head>
+<body>
+
+''')
 
-            print('  </tr>')
-        print('  </table>')
+        ligne('<table id="t01">')
 
-        print('</body>')
-        print('</html>')
+        # la ligne d'entête
+        ligne('  <tr>')
+        ligne('    <th>%s</th>' % 'Intf')
+        for m in mibs:
+            ligne('    <th>%s</th>' % m)
+        ligne('  </tr>')
+
+        for _, x, _ in MIBs_table_lignes(r, mibs, intf):
+            ligne(x)
+        ligne('  </table>')
+
+        ligne('</body>')
+        ligne('</html>')
+
+        sys.stdout.write("\n".join(page) + "\n")
 
     else:
         # affichage en markdown/texte
@@ -1075,47 +2241,114 @@ function fenetre_close() {
         pass
 
 
+##
+# @brief écrit le tableau croisé MIBs/Interfaces dans un répertoire: une page légère, et les
+#        détails de chaque interface dans details/<interface>.js, chargés au premier clic
+#
+#        les lignes sont écrites au fur et à mesure que les détails des interfaces arrivent
+#        (MIBs_table_lignes)
+#
+# @param r MIBs de toutes les interfaces (résultat de getMIBs)
+# @param mibs liste triée des MIBs
+# @param intf liste triée des interfaces
+# @param rep répertoire du rapport
+#
+# @return
+def MIBs_table_rep(r, mibs, intf, rep):
+    os.makedirs(os.path.join(rep, "details"), exist_ok=True)
+    nom = os.path.join(rep, "index.html")
+
+    with open(nom, "w", encoding="utf-8") as f:
+        f.write('<!DOCTYPE html>\n<html>\n<head>\n<meta charset="utf-8">\n\n')
+        f.write(MIBS_STYLE + '\n\n' + MIBS_SCRIPT_DIFFERE + '\n\n</head>\n<body>\n\n')
+
+        f.write('<table id="t01">\n')
+        f.write('  <tr>\n')
+        f.write('    <th>%s</th>\n' % 'Intf')
+        for m in mibs:
+            f.write('    <th>%s</th>\n' % m)
+        f.write('  </tr>\n')
+
+        for i, ligne, textes in MIBs_table_lignes(r, mibs, intf, differe=True):
+            f.write(ligne + "\n")
+            if textes:
+                with open(os.path.join(rep, "details", i + ".js"), "w", encoding="utf-8") as d:
+                    d.write("details_charge(%s, %s);\n" % (json.dumps(i), json.dumps(textes)))
+
+        f.write('  </table>\n')
+        f.write('</body>\n')
+        f.write('</html>\n')
+
+    debug(1, "rapport écrit dans", nom)
+
+
 ##
 # @brief dumpe toutes les MIBs dans un sous-répertoire mibs au format pretty print Python et décodé
 #
+#        les MIBs de chaque interface sont tirées d'un seul getMIBs traverse=all, les datamodels
+#        sont demandés en parallèle, et seuls les fichiers dont le contenu change sont réécrits
+#        (clés triées: le contenu ne dépend pas de l'ordre des réponses de la Livebox)
+#
 # @return
 def MIBs_save_cmd():
-    # liste toutes les interfaces
+    # liste toutes les interfaces, et les MIBs de toutes les interfaces
+    r_intf, r_mibs = requetes([("NeMo.Intf.lo:getIntfs", { "traverse": "all" }),
+                               ("NeMo.Intf.lo:getMIBs", { "traverse": "all" })])
     intf = set()
-    r = requete("NeMo.Intf.lo:getIntfs", { "traverse": "all" })
-    if not r is None:
-        for i in r['status']:
+    if not r_intf is None:
+        for i in r_intf.get('status') or []:
             intf.add(i)
 
+    # MIBs par interface: le contenu de getMIBs traverse=this
+    mibs_intf = {}
+    if r_mibs is not None and isinstance(r_mibs.get('status'), dict):
+        for m, v in r_mibs['status'].items():
+            for i, valeurs in v.items():
+                mibs_intf.setdefault(i, {})[m] = { i: valeurs }
+
     if not os.path.isdir("mibs"):
         os.makedirs("mibs")
 
+    intf = sorted(intf)
+
+    # les interfaces absentes du getMIBs global sont interrogées une par une
+    manquantes = [i for i in intf if i not in mibs_intf]
+    r = requetes([dict(chemin='NeMo.Intf.' + i, get=True) for i in intf] +
+                 [dict(chemin='NeMo.Intf.' + i + ':getMIBs', args={ "traverse": "this" }) for i in manquantes])
+    datamodels = r[:len(intf)]
+    for i, rr in zip(manquantes, r[len(intf):]):
+        # une interface sans réponse exploitable n'a pas de fichier .mib
+        mibs_intf[i] = rr.get('status') if isinstance(rr, dict) else None
+
+    ecrits = inchanges = 0
+
+    def ecrit(nom, texte):
+        nonlocal ecrits, inchanges
+        if ecrit_si_change("mibs/" + nom, texte.encode("utf-8")):
+            ecrits += 1
+        else:
+            inchanges += 1
+
     # dump les datamodels de chaque interface
-    for i in intf:
-        r = requete('NeMo.Intf.' + i, get=True)
+    for i, r in zip(intf, datamodels):
         if r is None: continue
 
         # le modèle en json
-        with open("mibs/" + i + ".dict", "w") as f:
-            # pprint.pprint(r, stream=f)
-            json.dump(r, f, indent=4)
-            f.close()
+        ecrit(i + ".dict", json.dumps(r, indent=4, sort_keys=True))
 
         # le modèle décodé
-        with open("mibs/" + i + ".model", "w") as f:
-            for j in r:
-                print("---------------------------------------------------------", file=f)
-                model(j, file=f)
-            f.close()
+        f = io.StringIO()
+        for j in r:
+            print("---------------------------------------------------------", file=f)
+            model(j, file=f)
+        ecrit(i + ".model", f.getvalue())
 
     # dump le contenu des MIBs par interface
     for i in intf:
-        r = requete('NeMo.Intf.' + i + ':getMIBs', { "traverse": "this" })
-        if r is None: continue
-        with open("mibs/" + i + ".mib", "w") as f:
-            # pprint.pprint(r, stream=f)
-            json.dump(r, f, indent=4)
-            f.close()
+        if mibs_intf.get(i) is None: continue
+        ecrit(i + ".mib", json.dumps({ "status": mibs_intf[i] }, indent=4, sort_keys=True))
+
+    print("MIBs: %d interfaces lues, %d fichiers écrits, %d inchangés" % (len(intf), ecrits, inchanges))
 
 
 def requete_object(path):
@@ -1407,12 +2640,16 @@ def add_commands(parser):
                         json.dump(host, sys.stdout, indent=4)
         else:
             #pprint.pprint(r['status'])
-            for _, host in r['status'].items():
+            mac_parser = get_mac_parser()
+            hosts = list(r['status'].values())
+            if mac_parser is not None:
+                manufs = mac_parser.get_manuf_many((host['MACAddress'] for host in hosts), strict=False)
+            for k, host in enumerate(hosts):
                 actif = " " if host['Active'] else "*"
                 if mac_parser is None:
                     s = "%-18s %-15s %c %-35s %s" % (host['MACAddress'], host['InterfaceType'], actif, host['HostName'], host['IPAddress'])
                 else:
-                    s = "%-18s %-12s %-15s %c %-35s %s" % (host['MACAddress'], mac_parser.get_manuf(host['MACAddress']), host.get('InterfaceType', ""), actif, host['HostName'], host['IPAddress'])
+                    s = "%-18s %-12s %-15s %c %-35s %s" % (host['MACAddress'], manufs[k], host.get('InterfaceType', ""), actif, host['HostName'], host['IPAddress'])
                 print(s)
 
     #
@@ -1447,14 +2684,19 @@ def add_commands(parser):
         if len(args) >= 2:
             prof = args[1]
 
-        r = requete(chemin, prof, get=True)
+        if crawl and prof is None:
+            r = crawl_model(chemin, crawl)
+        else:
+            # chaque noeud est affiché dès sa réception
+            r = requete_nodes(chemin, prof)
 
-        #pprint.pprint(r)
-        #print(json.dumps(r))
-        #print(type(r))
         if not r is None:
-            for i in r:
-                model(i)
+            try:
+                for i in r:
+                    model(i)
+            except ValueError as e:
+                error("erreur:", type(e))
+                error("mauvais json:", getattr(e, 'doc', str(e)))
 
 
     def object_cmd(args):
@@ -1506,14 +2748,17 @@ def add_commands(parser):
         else:
 
             if args[0] == "show":
+                r_intf, r_mibs = requetes([("NeMo.Intf.lo:getIntfs", { "traverse": "all" }),
+                                           ('NeMo.Intf.lo:getMIBs', { "traverse": "this" })])
+
                 intf = set()
-                r = requete("NeMo.Intf.lo:getIntfs", { "traverse": "all" })
+                r = r_intf
                 if not r is None:
                     for i in r['status']:
                         intf.add(i)
 
                 mibs = set()
-                r = requete('NeMo.Intf.lo:getMIBs', { "traverse": "this" })
+                r = r_mibs
                 if not r is None:
                     for i in r['status']:
                         mibs.add(i)
@@ -1525,7 +2770,7 @@ def add_commands(parser):
 
             elif args[0] == "table":
                 html = (len(args) >= 2 and args[1] == "html")
-                MIBs_table_cmd(html)
+                MIBs_table_cmd(html, args[2] if html and len(args) >= 3 else None)
 
             elif args[0] == "dump":
                 MIBs_save_cmd()
@@ -1835,6 +3080,9 @@ def add_commands(parser):
         if len(args) == 1 and args[0] == '?':
             return print(r[0].keys())
 
+        from dateutil.tz import tz
+        from dateutil import parser as parsedate
+
         for i in r:
             if len(args) > 0:
                 print(i[args[0]])
@@ -1853,6 +3101,46 @@ def add_commands(parser):
                     ))
 
 
+    def dump_cmd(args):
+        """ enregistre l'état de la Livebox dans un répertoire (dump par défaut): -dump [ répertoire ] """
+        if len(args) > 1:
+            error("Usage: -dump [répertoire]")
+            return
+        dump(args[0] if args else "dump", [
+            # les étapes les plus longues d'abord
+            ("model",           "model.txt",        lambda: model_cmd([])),
+            ("modelraw",        None,               lambda: model_raw_cmd(None, out="model.json")),
+            ("MIBs dump",       None,               lambda: MIBs_cmd(["dump"])),
+            ("MIBs table",      "mibs-table.md",    lambda: MIBs_cmd(["table"])),
+            ("MIBs table html", "mibs-table.html",  lambda: MIBs_cmd(["table", "html"])),
+            ("MIBs",            "mibs_all",         lambda: MIBs_cmd([])),
+            ("MIBs show",       "mibs.txt",         lambda: MIBs_cmd(["show"])),
+            ("graph",           None,               lambda: graph_cmd(["noview"])),
+            ("topo simple",     None,               lambda: topo_cmd(["simple", "noview"])),
+            ("topo",            None,               lambda: topo_cmd(["noview"])),
+            ("hosts",           "hosts.txt",        lambda: hosts_cmd([])),
+            ("info",            "info.txt",         lambda: info_cmd([])),
+            ("version",         "status.txt",       lambda: requete_print("DeviceInfo:get")),
+            ("scripts.js",      None,               lambda: telecharge("scripts.js")),
+            ("version.txt",     None,               lambda: telecharge("version.txt")),
+        ])
+
+
+    def batch_cmd(args):
+        """ exécute les requêtes d'un fichier (- pour l'entrée standard), une par ligne, résultats en NDJSON """
+        if len(args) != 1:
+            error("Usage: -batch FICHIER|-")
+            return
+        if args[0] == "-":
+            erreurs = batch(sys.stdin)
+        else:
+            with open(args[0], "r", encoding="utf-8") as f:
+                erreurs = batch(f)
+        # le code de sortie est le nombre de lignes en erreur
+        if erreurs:
+            sys.exit(min(erreurs, 255))
+
+
     ################################################################################
 
 
@@ -1863,6 +3151,46 @@ def add_commands(parser):
             parser.add_argument('-' + cmd[:-4], help=str.strip(func.__doc__ or ""), dest='run_auth', action='store_const', const=func)
 
 
+##
+# @brief analyse une requête sysbus et ses paramètres optionnels
+#        accepte aussi la forme 'NeMo.Intf.wl1.getParameters(name="NetDevIndex", flag="", traverse="down")'
+#
+# @param sysbus
+# @param args liste de paramètres nom=valeur
+#
+# @return (chemin, paramètres)
+# @exception ValueError si un paramètre n'est pas de la forme nom=valeur
+def analyse_requete(sysbus, args):
+    parameters = OrderedDict()
+    for i in args:
+        a = i.split("=", 1)
+        if len(a) != 2:
+            raise ValueError("paramètre sans valeur: %s" % i)
+        parameters[a[0]] = a[1]
+
+    # analyse une requête formulée comme les queries sur les NeMo.Intf.xxx :
+    # 'NeMo.Intf.wl1.getParameters(name="NetDevIndex", flag="", traverse="down")'
+    p = sysbus.find('(')
+    if p >= 0 and sysbus[-1] == ')' and sysbus.find('.') > 0:
+        i = sysbus.find(':')
+        if i == -1 or i > p:
+            # sépare le chemin des paramètres entre parenthèses
+            t = sysbus[p + 1:-1]
+            sysbus = sysbus[:p]
+
+            # remplace le dernier . par : (séparation du chemin du nom de la fonction)
+            p = sysbus.rfind('.')
+            sysbus = sysbus[0:p] + ':' + sysbus[p+1:]
+
+            # ajoute les arguments passés entre parenthèses
+            for i in t.split(','):
+                if i.find('=') > 0:
+                    a = i.strip().split('=', 1)
+                    parameters[a[0]] = a[1].strip('"')
+
+    return sysbus, parameters
+
+
 ##
 # @brief requête sybus avec paramètres optionnels
 #
@@ -1881,30 +3209,7 @@ def par_defaut(sysbus, args, raw=False):
         #    print("Livebox time: ", result['data']['time'])
 
     else:
-        parameters = OrderedDict()
-        for i in args:
-            a = i.split("=", 1)
-            parameters[a[0]] = a[1]
-
-        # analyse une requête formulée comme les queries sur les NeMo.Intf.xxx :
-        # 'NeMo.Intf.wl1.getParameters(name="NetDevIndex", flag="", traverse="down")'
-        p = sysbus.find('(')
-        if p >= 0 and sysbus[-1] == ')' and sysbus.find('.') > 0:
-            i = sysbus.find(':')
-            if i == -1 or i > p:
-                # sépare le chemin des paramètres entre parenthèses
-                t = sysbus[p + 1:-1]
-                sysbus = sysbus[:p]
-
-                # remplace le dernier . par : (séparation du chemin du nom de la fonction)
-                p = sysbus.rfind('.')
-                sysbus = sysbus[0:p] + ':' + sysbus[p+1:]
-
-                # ajoute les arguments passés entre parenthèses
-                for i in t.split(','):
-                    if i.find('=') > 0:
-                        a = i.strip().split('=', 1)
-                        parameters[a[0]] = a[1].strip('"')
+        sysbus, parameters = analyse_requete(sysbus, args)
 
         # envoie la requête
         if raw:
@@ -1915,18 +3220,259 @@ def par_defaut(sysbus, args, raw=False):
             requete_print(sysbus, parameters)
 
 
+##
+# @brief exécute une liste de requêtes sysbus, une par ligne (syntaxe de la ligne de commandes),
+#        et affiche un résultat NDJSON par ligne
+#
+# les méthodes de lecture sont exécutées en parallèle (--jobs), les autres servent de barrière
+# pour conserver l'ordre des modifications. une ligne invalide ou une requête en échec produit
+# un enregistrement avec "error" sans interrompre les autres
+#
+# @param f fichier ouvert en lecture
+# @param out fichier de sortie
+#
+# @return nombre de requêtes en erreur
+def batch(f, out=None):
+
+    out = out or sys.stdout
+    erreurs = 0
+
+    # (numéro, ligne, (chemin, paramètres) ou None, erreur)
+    def lignes():
+        for n, ligne in enumerate(f, 1):
+            ligne = ligne.strip()
+            if ligne == "" or ligne[0] == "#":
+                continue
+            try:
+                # la forme avec parenthèses peut contenir des espaces et des guillemets
+                if ligne[-1] == ')' and ligne.find('(') > 0:
+                    sysbus, args = ligne, []
+                else:
+                    args = shlex.split(ligne)
+                    sysbus, args = args[0], args[1:]
+                yield n, ligne, analyse_requete(sysbus, args), None
+            except ValueError as e:
+                yield n, ligne, None, str(e)
+
+    def execute(lot):
+        nonlocal erreurs
+        appels = [ a for _, _, a, _ in lot if a is not None ]
+        resultats = iter(requetes(appels, raw=True, exceptions=True) if appels else [])
+        for n, ligne, appel, erreur in lot:
+            o = OrderedDict([ ("line", n), ("request", ligne) ])
+            if appel is not None:
+                t = next(resultats)
+                if isinstance(t, BaseException):
+                    erreur = "%s: %s" % (type(t).__name__, t)
+                else:
+                    try:
+                        r = json.loads(t.decode('utf-8', errors='replace'))
+                        o["result"] = r['result'] if isinstance(r, dict) and 'result' in r else r
+                        # le résultat peut être un scalaire ou null
+                        if isinstance(o.get("result"), dict) and 'errors' in o["result"]:
+                            erreurs += 1
+                    except ValueError:
+                        erreur = "mauvais json: " + t.decode('utf-8', errors='replace')
+            if erreur is not None:
+                o["error"] = erreur
+                erreurs += 1
+            out.write(json.dumps(o) + "\n")
+        out.flush()
+
+    lot = []
+    for n, ligne, appel, erreur in lignes():
+        if appel is not None and not methode_lecture(appel[0]):
+            execute(lot)
+            execute([ (n, ligne, appel, erreur) ])
+            lot = []
+        else:
+            lot.append((n, ligne, appel, erreur))
+            if len(lot) >= jobs * 4:
+                execute(lot)
+                lot = []
+    execute(lot)
+
+    return erreurs
+
+
+##
+# @brief sortie standard aiguillée par thread: chaque étape d'un -dump écrit dans son fichier
+class SortieParThread:
+
+    ##
+    # @param defaut sortie des threads sans fichier attribué
+    def __init__(self, defaut):
+        self.defaut = defaut
+        self.local = threading.local()
+
+    def cible(self):
+        return getattr(self.local, 'f', None) or self.defaut
+
+    def write(self, s):
+        return self.cible().write(s)
+
+    def flush(self):
+        self.cible().flush()
+
+    def __getattr__(self, nom):
+        return getattr(self.cible(), nom)
+
+
+##
+# @brief télécharge un fichier du serveur web de la Livebox dans le répertoire courant
+#
+# @param nom
+#
+# @return
+def telecharge(nom):
+    r = get_session().get(URL_LIVEBOX + nom)
+    r.raise_for_status()
+    with open(nom, "wb") as f:
+        f.write(r.content)
+
+
+##
+# @brief nombre d'étapes d'un -dump exécutées simultanément: leurs requêtes parallèles se partagent
+#        les --jobs places, chacune peut y ajouter une requête directe
+DUMP_ETAPES = 3
+
+
+##
+# @brief enregistre l'état de la Livebox dans un répertoire (remplace dump-sysbus.sh)
+#
+#        les étapes s'exécutent dans le processus courant, DUMP_ETAPES à la fois: elles partagent
+#        la session, les places des requêtes parallèles et les lectures en cours ou déjà faites,
+#        et chacune écrit sa sortie standard dans son fichier. manifest.json liste les étapes avec
+#        leur durée et les fichiers produits. la progression est estimée d'après le nombre de
+#        réponses du dump précédent, ou à défaut d'après le nombre d'étapes terminées
+#
+# @param rep répertoire du dump
+# @param etapes liste de (nom, fichier de la sortie standard ou None, fonction)
+#
+# @return nombre d'étapes en erreur
+def dump(rep, etapes):
+    global dump_en_cours
+
+    os.makedirs(rep, exist_ok=True)
+    manifeste = os.path.join(rep, "manifest.json")
+    attendues = None
+    try:
+        with open(manifeste, "r", encoding="utf-8") as f:
+            attendues = json.load(f).get("responses")
+    except (OSError, ValueError, AttributeError):
+        pass
+
+    sortie = SortieParThread(sys.stdout)
+    terminees = []
+    depart = reponses
+    fin = threading.Event()
+
+    def affiche():
+        n = reponses - depart
+        s = "\rdump: %d/%d étapes, %d requêtes" % (len(terminees), len(etapes), n)
+        if attendues:
+            pct = n * 100 // attendues
+        else:
+            pct = len(terminees) * 100 // len(etapes)
+        s += " (%d%%)" % min(pct, 99 if len(terminees) < len(etapes) else 100)
+        sys.stderr.write(s)
+        sys.stderr.flush()
+
+    def affichage():
+        while not fin.wait(0.2):
+            affiche()
+
+    def etape(nom, fichier, fonction):
+        t = time.perf_counter()
+        erreur = None
+        with open(fichier or os.devnull, "w") as f:
+            sortie.local.f = f
+            try:
+                fonction()
+            except SystemExit as e:
+                if e.code:
+                    erreur = "code de sortie %s" % e.code
+            except Exception as e:
+                erreur = "%s: %s" % (type(e).__name__, e)
+            finally:
+                sortie.local.f = None
+        terminees.append(nom)
+        return OrderedDict([ ("step", nom), ("output", fichier), ("duration", round(time.perf_counter() - t, 3)),
+                             ("error", erreur) ])
+
+    debut = time.perf_counter()
+    date = datetime.datetime.now().astimezone().isoformat(timespec='seconds')
+    cwd = os.getcwd()
+    stdout = sys.stdout
+    tty = sys.stderr.isatty()
+    if tty:
+        threading.Thread(target=affichage, daemon=True).start()
+
+    os.chdir(rep)
+    sys.stdout = sortie
+    dump_en_cours = True
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=min(jobs, DUMP_ETAPES)) as executor:
+            resultats = [f.result() for f in [executor.submit(etape, *e) for e in etapes]]
+    finally:
+        dump_en_cours = False
+        sys.stdout = stdout
+        fin.set()
+        os.chdir(cwd)
+    if tty:
+        affiche()
+        sys.stderr.write("\n")
+    for r in resultats:
+        if r["error"]:
+            error("dump: %s: %s" % (r["step"], r["error"]))
+
+    # les fichiers du répertoire, y compris ceux des dumps précédents que les étapes n'ont pas réécrits
+    fichiers = []
+    for racine, reps, noms in os.walk(rep):
+        reps.sort()
+        for nom in sorted(noms):
+            chemin = os.path.join(racine, nom)
+            relatif = os.path.relpath(chemin, rep).replace(os.sep, "/")
+            if relatif == "manifest.json" or nom.startswith(".tmp-"):
+                continue
+            with open(chemin, "rb") as f:
+                empreinte = hashlib.sha1(f.read()).hexdigest()
+            fichiers.append(OrderedDict([ ("name", relatif), ("size", os.path.getsize(chemin)), ("sha1", empreinte) ]))
+
+    erreurs = sum(1 for r in resultats if r["error"])
+    duree = time.perf_counter() - debut
+    ecrit_atomique(manifeste, json.dumps(OrderedDict([
+        ("livebox", URL_LIVEBOX), ("date", date), ("duration", round(duree, 3)), ("responses", reponses - depart),
+        ("errors", erreurs), ("steps", resultats), ("files", fichiers) ]), indent=4).encode("utf-8"))
+
+    print("dump: %d étapes en %.1f s, %d requêtes, %d en erreur, %d fichiers dans %s" % (
+        len(etapes), duree, reponses - depart, erreurs, len(fichiers), rep))
+    return erreurs
+
+
 ##
 # @brief fonction principale
 #
+# @param argv arguments de la ligne de commandes (sys.argv[1:] par défaut)
+#
 # @return
-def main():
-    global USER_LIVEBOX, PASSWORD_LIVEBOX, URL_LIVEBOX, VERSION_LIVEBOX
-    global verbosity
+def main(argv=None):
+    global profil, mac_parser
+    global verbosity, jobs, check_auth, crawl, cache_enabled, cache_max_age
+
+    # transmet la commande au démon s'il est activé
+    if argv is None and daemon.client_enabled(sys.argv[1:]):
+        code = daemon.client(sys.argv[1:])
+        if code is not None:
+            sys.exit(code)
 
     parser = argparse.ArgumentParser(description='requêtes sysbus pour Livebox')
 
-    parser.add_argument("-v", "--verbose", action="count", default=verbosity)
+    parser.add_argument("-v", "--verbose", action="count", default=0)
+    parser.add_argument("-j", "--jobs", type=int, default=JOBS, help="nombre de requêtes simultanées (défaut: %d)" % JOBS)
     parser.add_argument("--update-oui", action="store_true", help="met à jour la base de données manuf")
+    parser.add_argument("--daemon", action="store_true", help="lance le démon qui garde la session ouverte")
+    parser.add_argument("--no-daemon", action="store_true", help="ne passe pas par le démon")
 
     # options "commandes"
     parser.add_argument('-scan', help="analyse les requêtes sysbus dans scripts.js",
@@ -1949,6 +3495,12 @@ def main():
             const=write_conf)
 
     parser.add_argument('-noauth', help="ne s'authentifie pas avant les requêtes", action='store_true', default=False)
+    parser.add_argument('--check-auth', help="vérifie le contexte mémorisé avant les requêtes", action='store_true', default=False)
+    parser.add_argument('--no-cache', help="n'utilise pas le cache des réponses", action='store_true', default=False)
+    parser.add_argument('--max-age', help="durée de validité des réponses en cache (secondes)", type=float, default=None)
+    parser.add_argument('--profile', help="profile la commande et affiche la répartition du temps", action='store_true', default=False)
+    parser.add_argument('--profile-out', help="comme --profile, et sauve les statistiques pstats dans FICHIER", metavar="FICHIER")
+    parser.add_argument('--trace', help="mesure les requêtes: trace Chrome si FICHIER se termine par .json, résumé sinon ('-': sortie d'erreur)", metavar="FICHIER")
 
     # modifications du comportement des commandes
     parser.add_argument('-raw', help="", action='store_true', default=False)
@@ -1957,6 +3509,7 @@ def main():
     # les commandes "requêtes"
     add_singles(parser)
     add_commands(parser)
+    parser.add_argument('--crawl', help="-model, -modelraw, -modeluml: récupère le datamodel par sous-arbres en parallèle, découpé sur CRAWL niveaux", nargs='?', type=int, const=1, default=None)
     parser.add_argument('-modelraw', help="", action='store_true', default=False)
     parser.add_argument('-modeluml', help="", action='store_true', default=False)
 
@@ -1965,18 +3518,57 @@ def main():
     parser.add_argument('parameters', help="paramètres", nargs='*')
 
     # analyse la ligne de commandes
-    args = parser.parse_args()
+    args = parser.parse_args(argv)
 
     verbosity = args.verbose
+    jobs = max(1, args.jobs)
+    check_auth = args.check_auth
+    crawl = args.crawl
+    cache_enabled = not args.no_cache
+    cache_max_age = args.max_age
+    memo_vide()
 
     if args.update_oui:
-        if mac_parser is None:
-            error("module anuf non trouvé")
+        MacParser = load_manuf()
+        if MacParser is None:
+            error("module manuf non trouvé")
             exit(2)
-        MacParser(manuf_name=manuf_name, update=True)
-        debug(1, "mise à jour:", manuf_name)
+        # la base n'est analysée et l'index reconstruit qu'une fois, et seulement si elle a changé
+        mac_parser = MacParser(manuf_name=manuf_name, index_name=oui_index(), refresh=False)
+        if mac_parser.update():
+            debug(1, "mise à jour:", manuf_name)
+        else:
+            debug(1, "base à jour:", manuf_name)
         exit(0)
 
+    if args.daemon:
+        sys.exit(daemon.serve(main, daemon.box_options(sys.argv[1:] if argv is None else argv)))
+
+    # le temps de démarrage n'a de sens que pour une exécution directe, pas dans le démon
+    profil = profiling.Profil(debut_import if argv is None else None) if args.profile or args.profile_out else None
+
+    if args.trace:
+        tracing.demarre()
+    try:
+        execute(args)
+    finally:
+        if args.trace:
+            tracing.arrete()
+            tracing.exporte(args.trace)
+        if profil is not None:
+            profil.termine(args.profile_out)
+            profil = None
+
+
+##
+# @brief exécute la commande demandée sur la ligne de commandes
+#
+# @param args arguments analysés par argparse
+#
+# @return
+def execute(args):
+    global USER_LIVEBOX, PASSWORD_LIVEBOX, URL_LIVEBOX, VERSION_LIVEBOX
+
     load_conf()
 
     new_session = False
@@ -1997,15 +3589,19 @@ def main():
         a = args.parameters
         if not args.sysbus is None:
             a.insert(0, args.sysbus)
+        if profil is not None:
+            profil.commande()
         args.run(a)
 
     else:
         if args.noauth:
             noauth()                        # initialise la session requests
-        else:
+        elif new_session or session_key != (URL_LIVEBOX, USER_LIVEBOX, VERSION_LIVEBOX):
             if not auth(new_session):       # initialise la session requests avec authentification
                 sys.exit(1)
 
+        if profil is not None:
+            profil.commande()
 
         if args.modelraw:
             prof = None if len(args.parameters) == 0 else args.parameters[0]
@@ -0,0 +1,364 @@
+#! /usr/bin/env python3
+# -*- encoding: utf-8 -*-
+# vim:set ts=4 sw=4 et:
+
+"""
+instrumentation des requêtes sysbus
+
+Chaque appel à la Livebox est enregistré dans une mesure: nom de l'appel, octets envoyés et reçus,
+durée des phases (dns, connect, ttfb, download, decode), nouvelles tentatives et réponses servies
+par les caches. Les mesures sont exportées au format Chrome trace event (chrome://tracing ou
+https://ui.perfetto.dev), ou résumées par appel avec un histogramme des durées.
+
+Tant que l'instrumentation n'est pas démarrée, les fonctions retournent une mesure nulle qui
+ne fait rien.
+"""
+
+import sys
+import os
+import json
+import time
+import threading
+import contextlib
+
+
+##
+# @brief phases d'un appel, dans l'ordre
+PHASES = ("dns", "connect", "ttfb", "download", "decode")
+
+##
+# @brief bornes de l'histogramme des durées (secondes)
+HISTOGRAMME = (0.001, 0.002, 0.005, 0.01, 0.02, 0.05, 0.1, 0.2, 0.5, 1., 2., 5.)
+
+
+actif = False
+origine = 0.
+mesures = []
+verrou = threading.Lock()
+local = threading.local()
+
+
+##
+# @brief mesure d'un appel
+class Mesure:
+
+    def __init__(self, nom, cat):
+        self.nom = nom
+        self.cat = cat
+        self.debut = time.perf_counter()
+        self.duree = None
+        self.tid = threading.get_ident()
+        self.phases = []        # (phase, début, durée) des phases à placer sur la trace
+        self.durees = {}        # phase -> durée cumulée
+        self.infos = {}
+        self._imbrique = 0.     # durée cumulée des itérations mesurées, cf. chrono()
+
+    ##
+    # @brief ajoute une durée à une phase
+    #
+    # @param phase
+    # @param debut instant de début (perf_counter), None pour ne pas la placer sur la trace
+    # @param duree
+    #
+    # @return
+    def ajoute(self, phase, debut, duree):
+        self.durees[phase] = self.durees.get(phase, 0.) + duree
+        if debut is not None:
+            self.phases.append((phase, debut, duree))
+
+    ##
+    # @brief mesure la durée d'un bloc
+    #
+    # @param phase
+    #
+    # @return
+    @contextlib.contextmanager
+    def phase(self, phase):
+        t = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.ajoute(phase, t, time.perf_counter() - t)
+
+    ##
+    # @brief mesure le temps passé à produire les éléments d'un itérable, sans compter le temps
+    #        des itérables mesurés qu'il consomme lui-même (ex: le décodage sans le téléchargement)
+    #
+    # @param phase
+    # @param iterable
+    # @param octets clé des infos où compter la taille des éléments
+    #
+    # @return générateur
+    def chrono(self, phase, iterable, octets=None):
+        it = iter(iterable)
+        fin = object()
+        while True:
+            t = time.perf_counter()
+            avant = self._imbrique
+            x = next(it, fin)
+            d = time.perf_counter() - t
+            self.ajoute(phase, None, d - (self._imbrique - avant))
+            self._imbrique = avant + d
+            if x is fin:
+                return
+            if octets:
+                self.compte(octets, len(x))
+            yield x
+
+    def info(self, cle, valeur):
+        self.infos[cle] = valeur
+
+    def compte(self, cle, n=1):
+        self.infos[cle] = self.infos.get(cle, 0) + n
+
+
+##
+# @brief mesure inactive
+class _Nulle:
+
+    def ajoute(self, phase, debut, duree):
+        pass
+
+    def phase(self, phase):
+        return self
+
+    def chrono(self, phase, iterable, octets=None):
+        return iterable
+
+    def info(self, cle, valeur):
+        pass
+
+    def compte(self, cle, n=1):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+NULLE = _Nulle()
+
+
+##
+# @brief démarre l'enregistrement des mesures
+#
+# @return
+def demarre():
+    global actif, origine
+    with verrou:
+        del mesures[:]
+    origine = time.perf_counter()
+    actif = True
+
+
+##
+# @brief arrête l'enregistrement
+#
+# @return
+def arrete():
+    global actif
+    actif = False
+
+
+##
+# @brief mesure en cours dans le thread
+#
+# @return
+def courante():
+    return getattr(local, 'mesure', None) or NULLE
+
+
+##
+# @brief crée une mesure, sans la rendre courante
+#
+# @param nom
+# @param cat
+#
+# @return
+def nouvelle(nom, cat):
+    return Mesure(nom, cat) if actif else NULLE
+
+
+##
+# @brief termine et enregistre une mesure
+#
+# @param m
+#
+# @return
+def termine(m):
+    if m is NULLE:
+        return
+    m.duree = time.perf_counter() - m.debut
+    with verrou:
+        mesures.append(m)
+
+
+##
+# @brief rend une mesure courante dans le thread le temps d'un bloc
+#
+# @param m
+#
+# @return
+@contextlib.contextmanager
+def active(m):
+    precedente = getattr(local, 'mesure', None)
+    local.mesure = None if m is NULLE else m
+    try:
+        yield m
+    finally:
+        local.mesure = precedente
+
+
+##
+# @brief mesure un appel: la mesure courante du thread si elle existe, une nouvelle sinon
+#
+# @param nom
+# @param cat
+#
+# @return
+@contextlib.contextmanager
+def mesure(nom, cat):
+    m = courante()
+    if m is not NULLE or not actif:
+        yield m
+        return
+    m = nouvelle(nom, cat)
+    try:
+        with active(m):
+            yield m
+    finally:
+        termine(m)
+
+
+##
+# @brief exporte les mesures
+#
+# @param fichier .json pour une trace Chrome, sinon un résumé ('-': sortie d'erreur)
+#
+# @return
+def exporte(fichier):
+    fin = time.perf_counter()
+    with verrou:
+        liste = sorted(mesures, key=lambda m: m.debut)
+
+    if fichier.endswith(".json"):
+        with open(fichier, "w") as f:
+            json.dump(trace_chrome(liste, fin), f, separators=(',', ':'))
+    elif fichier == "-":
+        resume(liste, fin, sys.stderr)
+    else:
+        with open(fichier, "w") as f:
+            resume(liste, fin, f)
+
+
+##
+# @brief convertit les mesures au format Chrome trace event
+#
+# @param liste
+# @param fin
+#
+# @return
+def trace_chrome(liste, fin):
+    pid = os.getpid()
+    us = lambda t: round((t - origine) * 1e6, 1)
+    threads = {}
+    principal = threading.main_thread().ident
+
+    def tid(ident):
+        if ident not in threads:
+            threads[ident] = 0 if ident == principal else len(threads) + 1
+        return threads[ident]
+
+    evts = [ { "name": "commande", "cat": "sysbus", "ph": "X", "pid": pid, "tid": tid(principal),
+               "ts": 0, "dur": us(fin) } ]
+
+    for m in liste:
+        args = dict(m.infos)
+        for p, d in m.durees.items():
+            args[p + "_ms"] = round(d * 1000., 3)
+        evts.append({ "name": m.nom, "cat": m.cat, "ph": "X", "pid": pid, "tid": tid(m.tid),
+                      "ts": us(m.debut), "dur": round(m.duree * 1e6, 1), "args": args })
+        for p, debut, d in m.phases:
+            evts.append({ "name": p, "cat": m.cat, "ph": "X", "pid": pid, "tid": tid(m.tid),
+                          "ts": us(debut), "dur": round(d * 1e6, 1) })
+
+    for ident, n in threads.items():
+        evts.append({ "name": "thread_name", "ph": "M", "pid": pid, "tid": n,
+                      "args": { "name": "principal" if n == 0 else "requêtes-%d" % n } })
+
+    return { "traceEvents": evts, "displayTimeUnit": "ms" }
+
+
+##
+# @brief durée pendant laquelle au moins un appel était en cours
+#
+# @param liste
+#
+# @return
+def duree_couverte(liste):
+    total = 0.
+    debut = fin = None
+    for m in liste:
+        if fin is None or m.debut > fin:
+            if fin is not None:
+                total += fin - debut
+            debut, fin = m.debut, m.debut + m.duree
+        else:
+            fin = max(fin, m.debut + m.duree)
+    if fin is not None:
+        total += fin - debut
+    return total
+
+
+##
+# @brief écrit le résumé des mesures: totaux par appel et histogramme des durées
+#
+# @param liste
+# @param fin
+# @param f
+#
+# @return
+def resume(liste, fin, f):
+    total = fin - origine
+    couvert = duree_couverte(liste)
+    caches = sum(1 for m in liste if 'cache' in m.infos)
+    retries = sum(m.infos.get('retries', 0) for m in liste)
+
+    print("%d appels en %.3f s: au moins un appel en cours pendant %.3f s (%d%%), %.3f s côté client"
+          % (len(liste), total, couvert, couvert * 100 / total if total > 0 else 0, total - couvert), file=f)
+    print("%d réponses servies par les caches, %d nouvelles tentatives" % (caches, retries), file=f)
+    print(file=f)
+
+    # regroupe par nom d'appel
+    groupes = {}
+    for m in liste:
+        groupes.setdefault(m.nom, []).append(m)
+
+    entete = "%-40s %5s %9s %9s %9s" % ("appel", "n", "total", "moyenne", "max")
+    entete += "".join(" %9s" % p for p in PHASES) + " %10s" % "octets"
+    print(entete, file=f)
+    for nom, ms in sorted(groupes.items(), key=lambda g: -sum(m.duree for m in g[1])):
+        s = sum(m.duree for m in ms)
+        ligne = "%-40s %5d %9.3f %9.3f %9.3f" % (nom[:40], len(ms), s, s / len(ms), max(m.duree for m in ms))
+        for p in PHASES:
+            ligne += " %9.3f" % sum(m.durees.get(p, 0.) for m in ms)
+        ligne += " %10d" % sum(m.infos.get('bytes_in', 0) for m in ms)
+        print(ligne, file=f)
+
+    print(file=f)
+    print("durée des appels", file=f)
+    classes = [ 0 ] * (len(HISTOGRAMME) + 1)
+    for m in liste:
+        k = 0
+        while k < len(HISTOGRAMME) and m.duree >= HISTOGRAMME[k]:
+            k += 1
+        classes[k] += 1
+    plus = max(classes) or 1
+    for k, n in enumerate(classes):
+        if k < len(HISTOGRAMME):
+            borne = "< %g ms" % (HISTOGRAMME[k] * 1000)
+        else:
+            borne = ">= %g ms" % (HISTOGRAMME[-1] * 1000)
+        print("%12s %5d %s" % (borne, n, "#" * (n * 50 // plus)), file=f)